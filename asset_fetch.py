@@ -0,0 +1,199 @@
+import hashlib
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_NAME = "manifest.json"
+MAX_REDIRECTS = 5
+MAX_ATTEMPTS = 3
+
+# Statuses reported for each asset
+FETCHED = "fetched"            # downloaded a new or changed copy
+NOT_MODIFIED = "not-modified"  # server confirmed our copy is current
+CACHED = "cached"              # verified locally, no request made
+FAILED = "failed"
+
+
+class FetchError(Exception):
+    """Raised when an asset cannot be downloaded or fails verification."""
+
+
+def sha256_file(path):
+    """Return the hex SHA-256 of a file, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(path):
+    """Load the asset manifest, or an empty one if it is missing or unreadable."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    """Write the manifest atomically so an interrupted run never corrupts it."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class ConnectionPool:
+    """Keeps one persistent HTTP connection per host for each worker thread."""
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def get(self, scheme, netloc):
+        connections = self.local.__dict__.setdefault('connections', {})
+        key = (scheme, netloc)
+        if key not in connections:
+            if scheme == 'https':
+                connections[key] = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                connections[key] = http.client.HTTPConnection(netloc, timeout=self.timeout)
+        return connections[key]
+
+    def discard(self, scheme, netloc):
+        """Drop a connection the server closed so the next request reconnects."""
+        connections = self.local.__dict__.get('connections', {})
+        conn = connections.pop((scheme, netloc), None)
+        if conn:
+            conn.close()
+
+
+def request(pool, url, headers):
+    """GET a URL over a pooled connection, following redirects. Returns (status, response, body)."""
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        conn = pool.get(parts.scheme, parts.netloc)
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError):
+            # A kept-alive connection may have been closed by the server; retry on a fresh one
+            pool.discard(parts.scheme, parts.netloc)
+            raise
+
+        if response.status in (301, 302, 303, 307, 308):
+            url = urllib.parse.urljoin(url, response.getheader('Location'))
+            continue
+
+        return response.status, response, body
+
+    raise FetchError(f"Too many redirects for {url}")
+
+
+def fetch_one(pool, filename, url, dest_dir, entry, headers, revalidate):
+    """Fetch a single asset. Returns (status, new manifest entry)."""
+    path = os.path.join(dest_dir, filename)
+
+    # A file that was already there before the manifest knew about it (such as
+    # the piece images shipped with the repo) is kept; delete it to fetch it again
+    if entry is None and os.path.exists(path):
+        return CACHED, {'url': url, 'sha256': sha256_file(path), 'size': os.path.getsize(path), 'local': True}
+
+    # Only trust validators if the file on disk is the one the manifest describes
+    verified = entry is not None and entry.get('url') == url and sha256_file(path) == entry.get('sha256')
+    if verified and (not revalidate or entry.get('local')):
+        return CACHED, entry
+
+    request_headers = dict(headers)
+    if verified:
+        if entry.get('etag'):
+            request_headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            request_headers['If-Modified-Since'] = entry['last_modified']
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            status, response, body = request(pool, url, request_headers)
+        except (http.client.HTTPException, OSError) as e:
+            if attempt == MAX_ATTEMPTS:
+                raise FetchError(f"{url}: {e}")
+            time.sleep(0.2 * 2 ** attempt)
+            continue
+
+        if status == 304 and verified:
+            return NOT_MODIFIED, entry
+        if status >= 500 and attempt < MAX_ATTEMPTS:
+            time.sleep(0.2 * 2 ** attempt)
+            continue
+        if status != 200:
+            raise FetchError(f"{url}: HTTP {status}")
+        break
+
+    # Make sure we received the whole body before replacing anything on disk
+    expected_length = response.getheader('Content-Length')
+    if expected_length is not None and int(expected_length) != len(body):
+        raise FetchError(f"{url}: expected {expected_length} bytes, got {len(body)}")
+
+    tmp_path = path + ".part"
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+
+    return FETCHED, {
+        'url': url,
+        'sha256': hashlib.sha256(body).hexdigest(),
+        'size': len(body),
+        'etag': response.getheader('ETag'),
+        'last_modified': response.getheader('Last-Modified'),
+    }
+
+
+def fetch_assets(assets, dest_dir, headers=None, max_workers=4, revalidate=True, timeout=30):
+    """Download assets concurrently into dest_dir, skipping ones that have not changed.
+
+    assets maps file names (relative to dest_dir) to URLs. A manifest of hashes and
+    HTTP validators is kept in dest_dir so unchanged files are never transferred
+    again; with revalidate=False verified files are not even re-checked with the
+    server. Files already in dest_dir that the manifest does not know yet are
+    kept and recorded as they are. Returns a dict mapping each file name to its status.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    manifest_path = os.path.join(dest_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    pool = ConnectionPool(timeout=timeout)
+    headers = headers or {}
+    results = {}
+
+    # The manifest is saved even if a run is cut short, so finished files are not fetched again
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(fetch_one, pool, filename, url, dest_dir, manifest.get(filename), headers,
+                                revalidate): filename
+                for filename, url in assets.items()
+            }
+            for future, filename in futures.items():
+                try:
+                    status, entry = future.result()
+                    manifest[filename] = entry
+                    results[filename] = status
+                    print(f"{filename}: {status}")
+                except (FetchError, OSError, ValueError, http.client.HTTPException) as e:
+                    # ValueError and HTTPException cover malformed URLs and response headers
+                    results[filename] = FAILED
+                    print(f"Error downloading {filename}: {e}")
+    finally:
+        save_manifest(manifest_path, manifest)
+    return results
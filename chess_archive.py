@@ -0,0 +1,399 @@
+import argparse
+import array
+import collections
+import itertools
+import mmap
+import multiprocessing
+import os
+import struct
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are not locked against each other
+    fcntl = None
+
+import chess
+import chess.pgn
+
+from chess_eval import encode_move, decode_move
+
+DEFAULT_ARCHIVE_PATH = os.path.join("games", "archive.cga")
+
+# Each record is a 4-byte length followed by that many bytes:
+#   header:  result code, flags, number of plies, start and end time (Unix seconds)
+#   strings: white name, black name and (if FLAG_FEN) the starting FEN, each 1-byte length prefixed
+#   moves:   about one byte per ply (see encode_moves)
+# The .idx file next to the archive holds the 8-byte offset of every record.
+RECORD_LENGTH = struct.Struct("<I")
+HEADER = struct.Struct("<BBHdd")
+OFFSET = struct.Struct("<Q")
+
+FLAG_FEN = 1
+# Moves are numbered in generation order (see encode_moves); records without
+# this flag, written by earlier versions, number them in move_key order
+FLAG_GENERATION_ORDER = 2
+
+RESULTS = ['*', '1-0', '0-1', '1/2-1/2']
+
+ArchivedGame = collections.namedtuple('ArchivedGame', 'white black result start_time end_time fen moves')
+
+
+def move_key(move):
+    """Sort key of the legal-move numbering used by records without FLAG_GENERATION_ORDER."""
+    return (move.to_square << 3) | (move.promotion or 0)
+
+
+def encode_moves(board, moves):
+    """Encode moves played from board, leaving the board at the final position.
+
+    Each move is one byte: the high nibble is the rank of the moving piece
+    among the mover's pieces in square order, the low nibble the move's index
+    among that piece's pseudo-legal moves, in python-chess's generation order.
+    Indices of 15 and up (only long queen or rook moves) store 15 and the
+    remainder in a second byte. Decoding then only generates the moves of one
+    piece per ply, with no legality checks or sorting.
+    """
+    data = bytearray()
+    for move in moves:
+        from_mask = chess.BB_SQUARES[move.from_square]
+        piece_rank = chess.popcount(board.occupied_co[board.turn] & (from_mask - 1))
+        index = list(board.generate_pseudo_legal_moves(from_mask)).index(move)
+        if index < 15:
+            data.append(piece_rank << 4 | index)
+        else:
+            data.append(piece_rank << 4 | 15)
+            data.append(index - 15)
+        board.push(move)
+    return bytes(data)
+
+
+def decode_moves(board, data, plies, generation_order=True):
+    """Decode plies moves encoded by encode_moves, leaving the board at the final position."""
+    moves = []
+    position = 0
+    for _ in range(plies):
+        byte = data[position]
+        position += 1
+        index = byte & 15
+        if index == 15:
+            index += data[position]
+            position += 1
+
+        pieces = board.occupied_co[board.turn]
+        for _ in range(byte >> 4):
+            pieces &= pieces - 1
+        from_mask = pieces & -pieces
+        if generation_order:
+            move = next(itertools.islice(board.generate_pseudo_legal_moves(from_mask), index, None))
+        else:
+            move = sorted(board.generate_legal_moves(from_mask), key=move_key)[index]
+        board.push(move)
+        moves.append(move)
+    return moves
+
+
+def _pack_string(text):
+    data = text.encode('utf-8')[:255]
+    return bytes([len(data)]) + data
+
+
+def encode_game(moves, white='', black='', result='*', start_time=0.0, end_time=0.0, fen=None):
+    """Serialize a game into an archive record (without the length prefix)."""
+    board = chess.Board(fen) if fen else chess.Board()
+    move_data = encode_moves(board, moves)
+    flags = FLAG_GENERATION_ORDER | (FLAG_FEN if fen else 0)
+    parts = [HEADER.pack(RESULTS.index(result), flags, len(moves), start_time, end_time),
+             _pack_string(white), _pack_string(black)]
+    if fen:
+        parts.append(_pack_string(fen))
+    parts.append(move_data)
+    return b''.join(parts)
+
+
+def decode_game(record):
+    """Deserialize an archive record (without the length prefix)."""
+    result, flags, plies, start_time, end_time = HEADER.unpack_from(record, 0)
+    offset = HEADER.size
+
+    strings = []
+    for _ in range(3 if flags & FLAG_FEN else 2):
+        length = record[offset]
+        strings.append(bytes(record[offset + 1:offset + 1 + length]).decode('utf-8', errors='replace'))
+        offset += 1 + length
+    fen = strings[2] if flags & FLAG_FEN else None
+
+    board = chess.Board(fen) if fen else chess.Board()
+    moves = decode_moves(board, record[offset:], plies, bool(flags & FLAG_GENERATION_ORDER))
+    return ArchivedGame(strings[0], strings[1], RESULTS[result], start_time, end_time, fen, moves)
+
+
+class GameArchive:
+    """Append-only file of compactly encoded games with an offset index for random access.
+
+    Reading never writes: games appended since the index was last written are
+    found by scanning past its end, and a record still being written (or cut
+    short by a crash) is ignored. Writers hold an exclusive lock on the
+    archive, under which a crashed writer's partial record is truncated and
+    the index brought up to date before anything is appended.
+    """
+
+    def __init__(self, path=DEFAULT_ARCHIVE_PATH):
+        self.path = path
+        self.index_path = path + ".idx"
+        self._map = None
+        self._map_file = None
+        self._offsets = None
+        self._offsets_sizes = None
+
+    @staticmethod
+    def _record_end(f, offset, size):
+        """Offset just past the record at offset, or None if it is not complete within size bytes."""
+        if offset + RECORD_LENGTH.size > size:
+            return None
+        f.seek(offset)
+        (length,) = RECORD_LENGTH.unpack(f.read(RECORD_LENGTH.size))
+        end = offset + RECORD_LENGTH.size + length
+        return end if end <= size else None
+
+    def _scan(self, f, size, indexed):
+        """Offsets of the complete records: the indexed ones, checked from the end, then any past them."""
+        while indexed and self._record_end(f, indexed[-1], size) is None:
+            indexed.pop()
+        offsets = indexed
+        offset = self._record_end(f, offsets[-1], size) if offsets else 0
+        while True:
+            end = self._record_end(f, offset, size)
+            if end is None:
+                return offsets, offset
+            offsets.append(offset)
+            offset = end
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path):
+            return []
+        with open(self.index_path, 'rb') as f:
+            return [value for (value,) in OFFSET.iter_unpack(f.read())]
+
+    def _repair(self, f):
+        """Truncate a partial trailing record and update the index. Only call with the write lock held."""
+        size = os.fstat(f.fileno()).st_size
+        count = os.path.getsize(self.index_path) // OFFSET.size if os.path.exists(self.index_path) else 0
+        if count:
+            # Fast path: the last indexed record ends exactly at the end of the file
+            with open(self.index_path, 'rb') as index:
+                index.seek((count - 1) * OFFSET.size)
+                (last,) = OFFSET.unpack(index.read(OFFSET.size))
+            if self._record_end(f, last, size) == size:
+                return
+        elif size == 0:
+            return
+
+        indexed = self._read_index()
+        offsets, end = self._scan(f, size, list(indexed))
+        if end < size:
+            print(f"Truncating incomplete record at byte {end} of {self.path}")
+            f.truncate(end)
+        if offsets != indexed:
+            with open(self.index_path + ".tmp", 'wb') as index:
+                index.write(b''.join(OFFSET.pack(value) for value in offsets))
+            os.replace(self.index_path + ".tmp", self.index_path)
+
+    def append(self, moves, white='', black='', result='*', start_time=0.0, end_time=0.0, fen=None):
+        """Add a game to the end of the archive."""
+        record = encode_game(moves, white, black, result, start_time, end_time, fen)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.path, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                self._repair(f)
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                f.write(RECORD_LENGTH.pack(len(record)) + record)
+                f.flush()
+                with open(self.index_path, 'ab') as index:
+                    index.write(OFFSET.pack(offset))
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def __len__(self):
+        return len(self.offsets())
+
+    def offsets(self):
+        """Byte offsets of every complete record."""
+        if not os.path.exists(self.path):
+            return []
+        sizes = (os.path.getsize(self.path),
+                 os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0)
+        if self._offsets is None or self._offsets_sizes != sizes:
+            with open(self.path, 'rb') as f:
+                self._offsets, _ = self._scan(f, sizes[0], self._read_index())
+            self._offsets_sizes = sizes
+        return self._offsets
+
+    def record(self, i):
+        """The raw bytes of record i, read through a memory map of the archive."""
+        offset = self.offsets()[i]
+        if self._map is None or offset + RECORD_LENGTH.size > len(self._map):
+            self._remap()
+        (length,) = RECORD_LENGTH.unpack_from(self._map, offset)
+        start = offset + RECORD_LENGTH.size
+        if start + length > len(self._map):
+            # Appended since the map was made
+            self._remap()
+        return self._map[start:start + length]
+
+    def _remap(self):
+        self.close()
+        self._map_file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._map_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, i):
+        """Decode game i."""
+        return decode_game(self.record(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.read(i)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map_file.close()
+            self._map = None
+            self._map_file = None
+
+
+def _decode_chunk(args):
+    """Pool worker: decode records [start, end) of an archive.
+
+    Moves are sent back packed by encode_move, since pickling chess.Move
+    objects costs more than re-creating them in the parent.
+    """
+    path, start, end = args
+    archive = GameArchive(path)
+    try:
+        return [game._replace(moves=array.array('H', map(encode_move, game.moves)).tobytes())
+                for game in (archive.read(i) for i in range(start, end))]
+    finally:
+        archive.close()
+
+
+def bulk_load(path=DEFAULT_ARCHIVE_PATH, processes=None, chunk_size=2000):
+    """Yield every game in an archive, decoding chunks of it in parallel worker processes."""
+    count = len(GameArchive(path))
+    chunks = [(path, start, min(start + chunk_size, count)) for start in range(0, count, chunk_size)]
+    with multiprocessing.Pool(processes) as pool:
+        for games in pool.imap(_decode_chunk, chunks):
+            for game in games:
+                yield game._replace(moves=[decode_move(value) for value in array.array('H', game.moves)])
+
+
+def game_to_pgn(game):
+    """Convert an archived game to a python-chess PGN game."""
+    board = chess.Board(game.fen) if game.fen else chess.Board()
+    pgn = chess.pgn.Game.from_board(board)
+    node = pgn
+    for move in game.moves:
+        node = node.add_variation(move)
+    pgn.headers["White"] = game.white or "?"
+    pgn.headers["Black"] = game.black or "?"
+    pgn.headers["Result"] = game.result
+    if game.start_time:
+        pgn.headers["Date"] = time.strftime("%Y.%m.%d", time.localtime(game.start_time))
+    return pgn
+
+
+def import_pgn(pgn_path, archive):
+    """Append every game of a PGN file to an archive. Returns the number of games imported."""
+    count = 0
+    with open(pgn_path, encoding='utf-8', errors='replace') as f:
+        while True:
+            game = chess.pgn.read_game(f)
+            if game is None:
+                break
+            fen = game.headers.get("FEN") if game.headers.get("SetUp") == "1" else None
+            result = game.headers.get("Result", "*")
+            archive.append(list(game.mainline_moves()), game.headers.get("White", ""),
+                           game.headers.get("Black", ""), result if result in RESULTS else "*", fen=fen)
+            count += 1
+    return count
+
+
+def export_pgn(archive, pgn_path):
+    """Write every game of an archive to a PGN file. Returns the number of games exported."""
+    count = 0
+    with open(pgn_path, 'w', encoding='utf-8') as f:
+        for game in archive:
+            print(game_to_pgn(game), file=f, end="\n\n")
+            count += 1
+    return count
+
+
+def benchmark(pgn_path):
+    """Time reading the games of a PGN file with python-chess against decoding them from an archive."""
+    def report(label, count, elapsed):
+        print(f"{label:>18}: {count} games in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} games/s)")
+
+    start = time.time()
+    count = 0
+    with open(pgn_path, encoding='utf-8', errors='replace') as f:
+        while True:
+            game = chess.pgn.read_game(f)
+            if game is None:
+                break
+            list(game.mainline_moves())
+            count += 1
+    report("PGN parsing", count, time.time() - start)
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive_path = os.path.join(directory, "bench.cga")
+        import_pgn(pgn_path, GameArchive(archive_path))
+
+        start = time.time()
+        archive = GameArchive(archive_path)
+        count = sum(1 for _ in archive)
+        archive.close()
+        report("archive, serial", count, time.time() - start)
+
+        start = time.time()
+        count = sum(1 for _ in bulk_load(archive_path))
+        report("archive, bulk_load", count, time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact binary game archive")
+    parser.add_argument('--archive', default=DEFAULT_ARCHIVE_PATH)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('import', help="append the games of a PGN file").add_argument('pgn')
+    subparsers.add_parser('export', help="write all games to a PGN file").add_argument('pgn')
+    subparsers.add_parser('load', help="decode every game in parallel and report the speed")
+    subparsers.add_parser('bench', help="compare decoding the games of a PGN file from PGN and from "
+                                        "a temporary archive").add_argument('pgn')
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        benchmark(args.pgn)
+        return
+
+    archive = GameArchive(args.archive)
+    start = time.time()
+    if args.command == 'import':
+        count = import_pgn(args.pgn, archive)
+        print(f"Imported {count} games into {args.archive} ({os.path.getsize(args.archive)} bytes)")
+    elif args.command == 'export':
+        count = export_pgn(archive, args.pgn)
+        print(f"Exported {count} games to {args.pgn}")
+    else:
+        count = sum(1 for _ in bulk_load(args.archive))
+        elapsed = time.time() - start
+        print(f"Decoded {count} games in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} games/s)")
+
+if __name__ == "__main__":
+    main()
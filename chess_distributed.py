@@ -0,0 +1,507 @@
+import argparse
+import collections
+import multiprocessing
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import chess
+import chess.engine
+
+from chess_eval import encode_move, decode_move
+from chess_player_ai import ChessGame
+
+# Wire format: every message is a 1-byte type and a 4-byte payload length,
+# followed by the payload itself (all integers in network byte order)
+FRAME = struct.Struct('!BI')
+
+MSG_HELLO = 1      # worker -> coordinator: worker name
+MSG_REQUEST = 2    # worker -> coordinator: ask for a work unit
+MSG_WORK = 3       # coordinator -> worker: a leased work unit
+MSG_WAIT = 4       # coordinator -> worker: nothing free yet, retry later
+MSG_SHUTDOWN = 5   # coordinator -> worker: all work is done
+MSG_RESULT = 6     # worker -> coordinator: result of a work unit
+MSG_RENEW = 7      # worker -> coordinator: still working, extend the lease
+
+# Kinds of work a coordinator can hand out
+UNIT_GAME = 1
+UNIT_ANALYSIS = 2
+
+# Difficulty names are sent as an index into this tuple
+DIFFICULTIES = ('easy', 'medium', 'hard', 'mcts')
+
+# Game outcomes as stored in results
+OUTCOME_WHITE = 0
+OUTCOME_BLACK = 1
+OUTCOME_DRAW = 2
+OUTCOME_UNFINISHED = 3
+
+NO_SCORE = -2 ** 31
+MATE_SCORE = 100000
+
+UNIT_HEADER = struct.Struct('!IBB')      # unit id, kind, difficulty index
+RESULT_HEADER = struct.Struct('!IB')     # unit id, kind
+GAME_RESULT = struct.Struct('!BH')       # outcome, number of plies
+ANALYSIS_ENTRY = struct.Struct('!Hi')    # encoded best move, score in centipawns
+COUNT = struct.Struct('!H')
+RECORD_LENGTH = struct.Struct('!I')
+
+WorkUnit = collections.namedtuple('WorkUnit', 'unit_id kind difficulty max_plies fens')
+GameResult = collections.namedtuple('GameResult', 'unit_id outcome moves')
+AnalysisResult = collections.namedtuple('AnalysisResult', 'unit_id entries')
+
+
+def send_message(sock, msg_type, payload=b''):
+    """Send one framed message."""
+    sock.sendall(FRAME.pack(msg_type, len(payload)) + payload)
+
+
+def recv_exact(sock, size):
+    """Read exactly size bytes, or return None if the peer closed the connection."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data.extend(chunk)
+    return bytes(data)
+
+
+def recv_message(sock):
+    """Read one framed message as (type, payload), or (None, None) on disconnect."""
+    header = recv_exact(sock, FRAME.size)
+    if header is None:
+        return None, None
+    msg_type, length = FRAME.unpack(header)
+    payload = recv_exact(sock, length) if length else b''
+    if payload is None:
+        return None, None
+    return msg_type, payload
+
+
+def encode_unit(unit):
+    """Serialize a work unit for a MSG_WORK payload."""
+    parts = [UNIT_HEADER.pack(unit.unit_id, unit.kind, DIFFICULTIES.index(unit.difficulty))]
+    if unit.kind == UNIT_GAME:
+        parts.append(COUNT.pack(unit.max_plies))
+    else:
+        parts.append(COUNT.pack(len(unit.fens)))
+        for fen in unit.fens:
+            data = fen.encode('ascii')
+            parts.append(struct.pack('!B', len(data)) + data)
+    return b''.join(parts)
+
+
+def decode_unit(payload):
+    """Deserialize a MSG_WORK payload into a work unit."""
+    unit_id, kind, difficulty = UNIT_HEADER.unpack_from(payload, 0)
+    offset = UNIT_HEADER.size
+    (count,) = COUNT.unpack_from(payload, offset)
+    offset += COUNT.size
+
+    if kind == UNIT_GAME:
+        return WorkUnit(unit_id, kind, DIFFICULTIES[difficulty], count, ())
+
+    fens = []
+    for _ in range(count):
+        length = payload[offset]
+        fens.append(payload[offset + 1:offset + 1 + length].decode('ascii'))
+        offset += 1 + length
+    return WorkUnit(unit_id, kind, DIFFICULTIES[difficulty], 0, tuple(fens))
+
+
+def encode_game_result(unit_id, outcome, moves):
+    """Serialize a finished self-play game: 2 bytes per ply."""
+    return (RESULT_HEADER.pack(unit_id, UNIT_GAME)
+            + GAME_RESULT.pack(outcome, len(moves))
+            + b''.join(COUNT.pack(encode_move(move)) for move in moves))
+
+
+def encode_analysis_result(unit_id, entries):
+    """Serialize analysed positions as (best move, score) pairs."""
+    parts = [RESULT_HEADER.pack(unit_id, UNIT_ANALYSIS), COUNT.pack(len(entries))]
+    for move, score in entries:
+        parts.append(ANALYSIS_ENTRY.pack(encode_move(move), NO_SCORE if score is None else score))
+    return b''.join(parts)
+
+
+def decode_result(payload):
+    """Deserialize a MSG_RESULT payload into a GameResult or AnalysisResult."""
+    unit_id, kind = RESULT_HEADER.unpack_from(payload, 0)
+    offset = RESULT_HEADER.size
+
+    if kind == UNIT_GAME:
+        outcome, plies = GAME_RESULT.unpack_from(payload, offset)
+        offset += GAME_RESULT.size
+        values = struct.unpack_from(f'!{plies}H', payload, offset)
+        return GameResult(unit_id, outcome, [decode_move(value) for value in values])
+
+    (count,) = COUNT.unpack_from(payload, offset)
+    offset += COUNT.size
+    entries = []
+    for _ in range(count):
+        move, score = ANALYSIS_ENTRY.unpack_from(payload, offset)
+        offset += ANALYSIS_ENTRY.size
+        entries.append((decode_move(move), None if score == NO_SCORE else score))
+    return AnalysisResult(unit_id, entries)
+
+
+def read_results(path):
+    """Yield every result stored in a coordinator output file."""
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(RECORD_LENGTH.size)
+            if len(header) < RECORD_LENGTH.size:
+                break
+            (length,) = RECORD_LENGTH.unpack(header)
+            yield decode_result(f.read(length))
+
+
+class WorkQueue:
+    """Hands out work units under leases and re-queues the ones that expire."""
+
+    def __init__(self, units, lease_timeout=60.0):
+        self.lock = threading.Lock()
+        self.pending = collections.deque(units)
+        self.units = {unit.unit_id: unit for unit in self.pending}
+        self.leases = {}  # unit id -> (unit, deadline, holder)
+        self.issued = collections.defaultdict(set)  # unit id -> connections it was leased to
+        self.completed = set()
+        self.total = len(self.pending)
+        self.lease_timeout = lease_timeout
+        self.all_done = threading.Event()
+        if self.total == 0:
+            self.all_done.set()
+
+    def acquire(self, holder=None):
+        """Lease the next pending unit to holder, or return None if nothing is free."""
+        with self.lock:
+            self._expire_leases()
+            if not self.pending:
+                return None
+            unit = self.pending.popleft()
+            self.leases[unit.unit_id] = (unit, time.monotonic() + self.lease_timeout, holder)
+            self.issued[unit.unit_id].add(holder)
+            return unit
+
+    def renew(self, unit_id, holder=None):
+        """Extend the lease of a unit a worker is still busy with."""
+        with self.lock:
+            if unit_id in self.leases:
+                unit, _, current = self.leases[unit_id]
+                # An expired lease may since have gone to another worker
+                if current is holder:
+                    self.leases[unit_id] = (unit, time.monotonic() + self.lease_timeout, holder)
+
+    def complete(self, unit_id, holder=None):
+        """Mark a unit done. Returns False for duplicates from a re-queued lease and for
+        units that were never leased to holder."""
+        with self.lock:
+            if unit_id not in self.units or unit_id in self.completed or holder not in self.issued[unit_id]:
+                return False
+            self.completed.add(unit_id)
+            self.leases.pop(unit_id, None)
+            del self.issued[unit_id]
+
+            # A unit that expired may be back in the queue while its first worker finished it
+            self.pending = collections.deque(u for u in self.pending if u.unit_id != unit_id)
+
+            if len(self.completed) == self.total:
+                self.all_done.set()
+            return True
+
+    def release(self, unit_ids, holder=None):
+        """Re-queue units still leased to a worker that disconnected."""
+        with self.lock:
+            for unit_id in unit_ids:
+                self.issued[unit_id].discard(holder)
+                # Skip units whose lease expired and was re-issued to another worker
+                if unit_id in self.leases and self.leases[unit_id][2] is holder:
+                    unit, _, _ = self.leases.pop(unit_id)
+                    self.pending.appendleft(unit)
+
+    def _expire_leases(self):
+        """Move leases past their deadline back to the front of the queue."""
+        now = time.monotonic()
+        expired = [unit_id for unit_id, (_, deadline, _) in self.leases.items() if deadline < now]
+        for unit_id in expired:
+            unit, _, _ = self.leases.pop(unit_id)
+            print(f"Lease on unit {unit_id} expired, re-queueing")
+            self.pending.appendleft(unit)
+
+
+class ResultWriter:
+    """Appends length-prefixed result records to the output file as they arrive."""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'ab')
+
+    def write(self, payload):
+        with self.lock:
+            self.file.write(RECORD_LENGTH.pack(len(payload)) + payload)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CoordinatorHandler(socketserver.BaseRequestHandler):
+    """Serves one worker connection."""
+
+    def handle(self):
+        queue = self.server.queue
+        held = set()
+        name = f"{self.client_address[0]}:{self.client_address[1]}"
+
+        try:
+            while True:
+                msg_type, payload = recv_message(self.request)
+                if msg_type is None:
+                    break
+
+                if msg_type == MSG_HELLO:
+                    name = payload.decode('utf-8') or name
+                    print(f"Worker {name} connected")
+                elif msg_type == MSG_REQUEST:
+                    unit = queue.acquire(self)
+                    if unit is not None:
+                        held.add(unit.unit_id)
+                        send_message(self.request, MSG_WORK, encode_unit(unit))
+                    elif queue.all_done.is_set():
+                        send_message(self.request, MSG_SHUTDOWN)
+                    else:
+                        send_message(self.request, MSG_WAIT, struct.pack('!f', self.server.poll_interval))
+                elif msg_type == MSG_RENEW:
+                    (unit_id,) = struct.unpack('!I', payload)
+                    queue.renew(unit_id, self)
+                elif msg_type == MSG_RESULT:
+                    # Decoding checks the payload is well formed before it is stored
+                    unit_id = decode_result(payload).unit_id
+                    held.discard(unit_id)
+                    if queue.complete(unit_id, self):
+                        self.server.results.write(payload)
+                    else:
+                        print(f"Ignoring result for unit {unit_id} from worker {name}")
+        except OSError as e:
+            print(f"Connection to worker {name} failed: {e}")
+        except (struct.error, ValueError) as e:
+            print(f"Dropping worker {name} after a malformed message: {e}")
+        finally:
+            # Anything this worker still held goes back to the queue
+            queue.release(held, self)
+            print(f"Worker {name} disconnected")
+
+
+class Coordinator(socketserver.ThreadingTCPServer):
+    """TCP server that leases work units to workers and collects their results."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, queue, output_path, poll_interval=1.0):
+        super().__init__(address, CoordinatorHandler)
+        self.queue = queue
+        self.results = ResultWriter(output_path)
+        self.poll_interval = poll_interval
+
+    def serve_until_done(self, grace=2.0, workers_alive=None):
+        """Serve workers until every unit is complete, then stop.
+
+        workers_alive, if given, is polled so a run whose workers have all
+        exited does not wait forever.
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        while not self.queue.all_done.wait(1.0):
+            if workers_alive is not None and not workers_alive():
+                print(f"All workers exited with {self.queue.total - len(self.queue.completed)} units unfinished")
+                break
+
+        # Leave idle workers time to ask again and receive MSG_SHUTDOWN
+        time.sleep(grace)
+        self.shutdown()
+        self.server_close()
+        self.results.close()
+
+
+def make_game_units(count, difficulty, max_plies=300):
+    """Create self-play work units."""
+    return [WorkUnit(i, UNIT_GAME, difficulty, max_plies, ()) for i in range(count)]
+
+
+def make_analysis_units(fens, difficulty, batch_size=32):
+    """Split positions into analysis work units of batch_size positions each."""
+    return [WorkUnit(i, UNIT_ANALYSIS, difficulty, 0, tuple(fens[start:start + batch_size]))
+            for i, start in enumerate(range(0, len(fens), batch_size))]
+
+
+def game_outcome(board):
+    """Map a board's final state to an outcome code."""
+    outcome = board.outcome()
+    if outcome is None:
+        return OUTCOME_UNFINISHED
+    if outcome.winner is None:
+        return OUTCOME_DRAW
+    return OUTCOME_WHITE if outcome.winner == chess.WHITE else OUTCOME_BLACK
+
+
+def play_game(game, unit, renew):
+    """Play one self-play game using the computer's move selection for both sides."""
+    board = chess.Board()
+    while not board.is_game_over() and len(board.move_stack) < unit.max_plies:
+        board.push(game.select_computer_move(board))
+        if len(board.move_stack) % 20 == 0:
+            renew()
+    return encode_game_result(unit.unit_id, game_outcome(board), board.move_stack)
+
+
+def analyse_positions(game, unit, renew):
+    """Pick a move for, and score when an engine is available, each position in a batch."""
+    entries = []
+    for fen in unit.fens:
+        board = chess.Board(fen)
+        if board.is_game_over():
+            entries.append((None, None))
+            continue
+
+        score = None
+        if game.engine:
+            limit = chess.engine.Limit(time=0.1 * game.difficulty_levels[game.difficulty])
+            info = game.engine.analyse(board, limit)
+            score = info["score"].white().score(mate_score=MATE_SCORE)
+
+        entries.append((game.select_computer_move(board), score))
+        renew()
+    return encode_analysis_result(unit.unit_id, entries)
+
+
+def run_worker(host, port, name=None, nnue_path=None):
+    """Connect to a coordinator and process work units until told to stop.
+
+    nnue_path, if given, is a network weights file the worker's built-in
+    engines evaluate with (see chess_nnue.py).
+    """
+    name = name or f"{socket.gethostname()}-{multiprocessing.current_process().pid}"
+    games = {}  # difficulty -> ChessGame, so each engine is only started once
+
+    try:
+        with socket.create_connection((host, port)) as sock:
+            send_message(sock, MSG_HELLO, name.encode('utf-8'))
+
+            while True:
+                send_message(sock, MSG_REQUEST)
+                msg_type, payload = recv_message(sock)
+
+                if msg_type is None or msg_type == MSG_SHUTDOWN:
+                    break
+                if msg_type == MSG_WAIT:
+                    (delay,) = struct.unpack('!f', payload)
+                    time.sleep(delay)
+                    continue
+
+                unit = decode_unit(payload)
+                if unit.difficulty not in games:
+                    games[unit.difficulty] = ChessGame(difficulty=unit.difficulty, nnue_path=nnue_path)
+                game = games[unit.difficulty]
+
+                def renew():
+                    send_message(sock, MSG_RENEW, struct.pack('!I', unit.unit_id))
+
+                if unit.kind == UNIT_GAME:
+                    result = play_game(game, unit, renew)
+                else:
+                    result = analyse_positions(game, unit, renew)
+                send_message(sock, MSG_RESULT, result)
+    except OSError as e:
+        print(f"Worker {name} lost its coordinator: {e}")
+    finally:
+        for game in games.values():
+            if game.engine:
+                game.engine.quit()
+
+
+def run_local(units, workers, output_path, lease_timeout, nnue_path=None):
+    """Run a coordinator and several worker processes on localhost."""
+    queue = WorkQueue(units, lease_timeout=lease_timeout)
+    coordinator = Coordinator(('127.0.0.1', 0), queue, output_path, poll_interval=0.2)
+    port = coordinator.server_address[1]
+
+    processes = [multiprocessing.Process(target=run_worker, args=('127.0.0.1', port, f"local-{i}", nnue_path))
+                 for i in range(workers)]
+
+    start = time.time()
+    for process in processes:
+        process.start()
+    coordinator.serve_until_done(grace=0.5, workers_alive=lambda: any(p.is_alive() for p in processes))
+    for process in processes:
+        process.join()
+
+    print(f"Completed {len(queue.completed)} of {queue.total} units with {workers} workers "
+          f"in {time.time() - start:.1f}s")
+
+
+def load_units(args):
+    """Build the work units requested on the command line."""
+    if args.positions:
+        fens = []
+        with open(args.positions) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                # A bad position would fail in every worker its unit is leased to
+                try:
+                    board = chess.Board(line.strip())
+                except ValueError as e:
+                    print(f"Skipping line {line_number} of {args.positions}: {e}")
+                    continue
+                if not board.is_valid():
+                    print(f"Skipping line {line_number} of {args.positions}: not a legal position")
+                    continue
+                fens.append(board.fen())
+        return make_analysis_units(fens, args.difficulty, args.batch_size)
+    return make_game_units(args.games, args.difficulty, args.max_plies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed self-play and analysis")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+
+    for mode in ('coordinator', 'local'):
+        sub = subparsers.add_parser(mode)
+        sub.add_argument('--games', type=int, default=10, help="number of self-play games")
+        sub.add_argument('--positions', help="file with one FEN per line to analyse instead")
+        sub.add_argument('--batch-size', type=int, default=32, help="positions per analysis unit")
+        sub.add_argument('--max-plies', type=int, default=300, help="cut self-play games off after this")
+        sub.add_argument('--difficulty', choices=DIFFICULTIES, default='easy')
+        sub.add_argument('--lease-timeout', type=float, default=60.0, help="seconds before a unit is re-queued")
+        sub.add_argument('--output', default='results.bin', help="file results are appended to")
+
+    subparsers.choices['coordinator'].add_argument('--host', default='0.0.0.0')
+    subparsers.choices['coordinator'].add_argument('--port', type=int, default=5555)
+    subparsers.choices['local'].add_argument('--workers', type=int, default=4)
+    subparsers.choices['local'].add_argument('--nnue', help="network weights file for the workers' "
+                                                            "built-in engines (see chess_nnue.py)")
+
+    worker = subparsers.add_parser('worker')
+    worker.add_argument('--host', default='127.0.0.1')
+    worker.add_argument('--port', type=int, default=5555)
+    worker.add_argument('--name')
+    worker.add_argument('--nnue', help="network weights file for the built-in engines (see chess_nnue.py)")
+
+    args = parser.parse_args()
+
+    if args.mode == 'worker':
+        run_worker(args.host, args.port, args.name, args.nnue)
+    elif args.mode == 'local':
+        run_local(load_units(args), args.workers, args.output, args.lease_timeout, args.nnue)
+    else:
+        queue = WorkQueue(load_units(args), lease_timeout=args.lease_timeout)
+        coordinator = Coordinator((args.host, args.port), queue, args.output)
+        print(f"Coordinating {queue.total} units on {args.host}:{args.port}")
+        coordinator.serve_until_done()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import chess
+import numpy as np
+
+# Material values in centipawns, indexed by chess piece type (index 0 unused)
+PIECE_VALUES = np.array([0, 100, 320, 330, 500, 900, 0], dtype=np.int32)
+
+# Piece-square tables from White's point of view, written rank 8 first as they
+# appear on a diagram (the "simplified evaluation function" tables)
+_PST_DIAGRAMS = {
+    chess.PAWN: [
+        0,   0,   0,   0,   0,   0,   0,   0,
+        50,  50,  50,  50,  50,  50,  50,  50,
+        10,  10,  20,  30,  30,  20,  10,  10,
+        5,   5,  10,  25,  25,  10,   5,   5,
+        0,   0,   0,  20,  20,   0,   0,   0,
+        5,  -5, -10,   0,   0, -10,  -5,   5,
+        5,  10,  10, -20, -20,  10,  10,   5,
+        0,   0,   0,   0,   0,   0,   0,   0,
+    ],
+    chess.KNIGHT: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20,   0,   0,   0,   0, -20, -40,
+        -30,   0,  10,  15,  15,  10,   0, -30,
+        -30,   5,  15,  20,  20,  15,   5, -30,
+        -30,   0,  15,  20,  20,  15,   0, -30,
+        -30,   5,  10,  15,  15,  10,   5, -30,
+        -40, -20,   0,   5,   5,   0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    chess.BISHOP: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,  10,  10,   5,   0, -10,
+        -10,   5,   5,  10,  10,   5,   5, -10,
+        -10,   0,  10,  10,  10,  10,   0, -10,
+        -10,  10,  10,  10,  10,  10,  10, -10,
+        -10,   5,   0,   0,   0,   0,   5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    chess.ROOK: [
+        0,   0,   0,   0,   0,   0,   0,   0,
+        5,  10,  10,  10,  10,  10,  10,   5,
+        -5,   0,   0,   0,   0,   0,   0,  -5,
+        -5,   0,   0,   0,   0,   0,   0,  -5,
+        -5,   0,   0,   0,   0,   0,   0,  -5,
+        -5,   0,   0,   0,   0,   0,   0,  -5,
+        -5,   0,   0,   0,   0,   0,   0,  -5,
+        0,   0,   0,   5,   5,   0,   0,   0,
+    ],
+    chess.QUEEN: [
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,   5,   5,   5,   0, -10,
+        -5,   0,   5,   5,   5,   5,   0,  -5,
+        0,   0,   5,   5,   5,   5,   0,  -5,
+        -10,   5,   5,   5,   5,   5,   0, -10,
+        -10,   0,   5,   0,   0,   0,   0, -10,
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+    ],
+    chess.KING: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20,  20,   0,   0,   0,   0,  20,  20,
+        20,  30,  10,   0,   0,  10,  30,  20,
+    ],
+}
+
+# The same tables indexed by python-chess square (a1 = 0), shape (7, 64)
+PIECE_SQUARE_TABLES = np.zeros((7, 64), dtype=np.int32)
+for _piece_type, _diagram in _PST_DIAGRAMS.items():
+    PIECE_SQUARE_TABLES[_piece_type] = np.array(_diagram, dtype=np.int32).reshape(8, 8)[::-1].ravel()
+
+# Pawn structure terms in centipawns; the passed pawn bonus is indexed by how
+# many ranks the pawn has advanced from its own back rank
+PASSED_PAWN_BONUS = [0, 5, 10, 20, 35, 60, 100, 0]
+DOUBLED_PAWN_PENALTY = 10
+ISOLATED_PAWN_PENALTY = 15
+
+# Default table sizes (entries, powers of two)
+EVAL_CACHE_SIZE = 1 << 18
+PAWN_HASH_SIZE = 1 << 14
+
+_MASK64 = (1 << 64) - 1
+_NO_PAWNS_ENTRY = _MASK64  # no real pawn bitboard has every square set
+
+_ADJACENT_FILES = [(chess.BB_FILES[f - 1] if f > 0 else 0) | (chess.BB_FILES[f + 1] if f < 7 else 0)
+                   for f in range(8)]
+
+# Squares that must be free of enemy pawns for a pawn to be passed, per color and square
+_PASSED_MASKS = {chess.WHITE: [0] * 64, chess.BLACK: [0] * 64}
+for _square in chess.SQUARES:
+    _file, _rank = chess.square_file(_square), chess.square_rank(_square)
+    _span = chess.BB_FILES[_file] | _ADJACENT_FILES[_file]
+    _PASSED_MASKS[chess.WHITE][_square] = _span & _MASK64 & ~((1 << (8 * (_rank + 1))) - 1)
+    _PASSED_MASKS[chess.BLACK][_square] = _span & ((1 << (8 * _rank)) - 1)
+
+# Boards are encoded as 64 piece codes: 0 for an empty square, 1-6 for white
+# pawn..king and 7-12 for black pawn..king
+PIECE_CODES = [(color, piece_type) for color in (chess.WHITE, chess.BLACK) for piece_type in chess.PIECE_TYPES]
+
+_SQUARES = np.arange(64)
+_CODE_NUMBERS = np.arange(1, 13, dtype=np.uint8)[:, None]
+
+
+def board_to_masks(board):
+    """The board's 12 piece bitboards in PIECE_CODES order."""
+    return np.array([board.pieces_mask(piece_type, color) for color, piece_type in PIECE_CODES], dtype='<u8')
+
+
+def masks_to_codes(masks):
+    """Turn bitboards of shape (..., 12) into piece codes of shape (..., 64)."""
+    masks = np.ascontiguousarray(masks, dtype='<u8')
+    bits = np.unpackbits(masks.view(np.uint8).reshape(masks.shape + (8,)), axis=-1, bitorder='little')
+    return (bits * _CODE_NUMBERS).sum(axis=-2, dtype=np.uint8)
+
+
+def boards_to_codes(boards):
+    """Piece codes of shape (len(boards), 64) for a list of boards."""
+    return masks_to_codes(np.array([board_to_masks(board) for board in boards], dtype='<u8'))
+
+
+# Moves are packed into 16 bits; this value stands for no move (None)
+NO_MOVE = 0xFFFF
+
+
+def encode_move(move):
+    """Pack a move into 16 bits: from square, to square and promotion piece."""
+    if move is None:
+        return NO_MOVE
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def decode_move(value):
+    """Unpack a move packed by encode_move."""
+    value = int(value)
+    if value == NO_MOVE:
+        return None
+    return chess.Move(value & 63, (value >> 6) & 63, promotion=(value >> 12) or None)
+
+
+def build_weights(piece_values, piece_square_tables):
+    """Combine material and piece-square tables into a (13, 64) table of White-positive scores per code."""
+    weights = np.zeros((13, 64), dtype=np.int32)
+    for code, (color, piece_type) in enumerate(PIECE_CODES, start=1):
+        if color == chess.WHITE:
+            weights[code] = piece_values[piece_type] + piece_square_tables[piece_type]
+        else:
+            # Black uses the tables mirrored top to bottom
+            weights[code] = -(piece_values[piece_type] + piece_square_tables[piece_type][_SQUARES ^ 56])
+    return weights
+
+
+def save_piece_square_tables(path, piece_square_tables):
+    """Write (7, 64) piece-square tables (e.g. tuned ones) to a .npy file."""
+    np.save(path, np.asarray(piece_square_tables, dtype=np.int32))
+
+
+def load_piece_square_tables(path):
+    """Read piece-square tables written by save_piece_square_tables."""
+    tables = np.load(path)
+    if tables.shape != (7, 64):
+        raise ValueError(f"expected piece-square tables of shape (7, 64), got {tables.shape}")
+    return tables.astype(np.int32)
+
+
+def pawn_structure(white_pawns, black_pawns):
+    """Passed, doubled and isolated pawn score (White-positive) for two pawn bitboards."""
+    score = 0
+    for color, pawns, enemy_pawns, sign in ((chess.WHITE, white_pawns, black_pawns, 1),
+                                            (chess.BLACK, black_pawns, white_pawns, -1)):
+        for file in range(8):
+            count = chess.popcount(pawns & chess.BB_FILES[file])
+            if count > 1:
+                score -= sign * DOUBLED_PAWN_PENALTY * (count - 1)
+            if count and not pawns & _ADJACENT_FILES[file]:
+                score -= sign * ISOLATED_PAWN_PENALTY * count
+
+        for square in chess.scan_forward(pawns):
+            if not enemy_pawns & _PASSED_MASKS[color][square]:
+                advanced = chess.square_rank(square) if color == chess.WHITE else 7 - chess.square_rank(square)
+                score += sign * PASSED_PAWN_BONUS[advanced]
+    return score
+
+
+class EvalCache:
+    """Fixed-size table of evaluations indexed by the low bits of the position's Zobrist key."""
+
+    def __init__(self, size=EVAL_CACHE_SIZE):
+        self.mask = size - 1
+        self.keys = np.zeros(size, dtype=np.uint64)
+        self.scores = np.zeros(size, dtype=np.int32)
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key):
+        """The cached score for key, or None."""
+        index = key & self.mask
+        if self.keys[index] == key:
+            self.hits += 1
+            return int(self.scores[index])
+        self.misses += 1
+        return None
+
+    def store(self, key, score):
+        index = key & self.mask
+        self.keys[index] = key
+        self.scores[index] = score
+
+
+class PawnHashTable:
+    """Fixed-size table of pawn structure scores keyed by both sides' pawn bitboards.
+
+    Pawn structure changes only on pawn moves and captures of pawns, so most
+    lookups during a search hit.
+    """
+
+    def __init__(self, size=PAWN_HASH_SIZE):
+        self.shift = 64 - (size.bit_length() - 1)
+        self.white = np.full(size, _NO_PAWNS_ENTRY, dtype=np.uint64)
+        self.black = np.zeros(size, dtype=np.uint64)
+        self.scores = np.zeros(size, dtype=np.int32)
+        self.hits = 0
+        self.misses = 0
+
+    def score(self, white_pawns, black_pawns):
+        """Pawn structure score, computed only on a miss."""
+        # Multiplicative hashing: the top bits of the products depend on every pawn
+        mixed = ((white_pawns * 0x9E3779B97F4A7C15) ^ (black_pawns * 0xC2B2AE3D27D4EB4F)) & _MASK64
+        index = mixed >> self.shift
+        if self.white[index] == white_pawns and self.black[index] == black_pawns:
+            self.hits += 1
+            return int(self.scores[index])
+
+        self.misses += 1
+        score = pawn_structure(white_pawns, black_pawns)
+        self.white[index] = white_pawns
+        self.black[index] = black_pawns
+        self.scores[index] = score
+        return score
+
+
+class ClassicEvaluator:
+    """Material, piece-square and pawn structure evaluation, vectorized over batches of positions.
+
+    Scores are in centipawns from White's point of view. Single evaluations
+    given a Zobrist key go through an evaluation cache; pawn structure always
+    goes through a pawn hash table.
+    """
+
+    def __init__(self, piece_values=PIECE_VALUES, piece_square_tables=PIECE_SQUARE_TABLES,
+                 eval_cache_size=EVAL_CACHE_SIZE, pawn_hash_size=PAWN_HASH_SIZE):
+        self.weights = build_weights(piece_values, piece_square_tables)
+        self.eval_cache = EvalCache(eval_cache_size)
+        self.pawn_hash = PawnHashTable(pawn_hash_size)
+
+    def evaluate_codes(self, codes):
+        """Material and piece-square score of piece codes of shape (n, 64)."""
+        return self.weights[codes, _SQUARES].sum(axis=-1)
+
+    def pawn_score(self, board):
+        return self.pawn_hash.score(board.pieces_mask(chess.PAWN, chess.WHITE),
+                                    board.pieces_mask(chess.PAWN, chess.BLACK))
+
+    def evaluate_batch(self, boards):
+        """Score a list of boards at once."""
+        if not boards:
+            return np.zeros(0, dtype=np.int32)
+        pawn_scores = np.array([self.pawn_score(board) for board in boards], dtype=np.int32)
+        return self.evaluate_codes(boards_to_codes(boards)) + pawn_scores
+
+    def evaluate(self, board, key=None):
+        """Score a single board; key is its Zobrist hash, if the caller has it."""
+        if key is not None:
+            score = self.eval_cache.probe(key)
+            if score is not None:
+                return score
+
+        score = int(self.evaluate_codes(masks_to_codes(board_to_masks(board)))) + self.pawn_score(board)
+        if key is not None:
+            self.eval_cache.store(key, score)
+        return score
+
+    def reset_stats(self):
+        self.eval_cache.hits = self.eval_cache.misses = 0
+        self.pawn_hash.hits = self.pawn_hash.misses = 0
+
+    def stats(self):
+        """Hit and miss counters of the caches, by name."""
+        return {
+            'eval cache': (self.eval_cache.hits, self.eval_cache.misses),
+            'pawn hash': (self.pawn_hash.hits, self.pawn_hash.misses),
+        }
@@ -0,0 +1,414 @@
+import argparse
+import collections
+import heapq
+import io
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+from chess_eval import NO_MOVE, encode_move, decode_move
+
+DEFAULT_INDEX_PATH = os.path.join("explorer", "index")
+
+# Fixed-width little-endian records, both sorted by their leading fields:
+#   positions: Zobrist key, next move, games, white wins, draws, black wins
+#   games:     Zobrist key, source file id, byte offset of the game in that file
+POSITION_RECORD = struct.Struct("<QHIIII")
+GAME_RECORD = struct.Struct("<QHQ")
+
+# Entries buffered in memory before a sorted run is written out while building
+RUN_SIZE = 2000000
+
+MoveStats = collections.namedtuple('MoveStats', 'move games white draws black')
+ExploreResult = collections.namedtuple('ExploreResult', 'games white draws black moves game_offsets')
+
+_RESULTS = {'1-0': 0, '1/2-1/2': 1, '0-1': 2}
+
+
+def iter_pgn_games(path, start=0):
+    """Yield (byte offset, text) for every game in a PGN file, starting at byte `start`."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        offset = start
+        game_start = None
+        lines = []
+        in_movetext = False
+
+        for line in f:
+            # A header line after movetext starts the next game
+            if line.startswith(b'[') and in_movetext:
+                yield game_start, b''.join(lines).decode('utf-8', errors='replace')
+                game_start = None
+                lines = []
+                in_movetext = False
+
+            if game_start is None and line.strip():
+                game_start = offset
+            if game_start is not None:
+                lines.append(line)
+            if line.strip() and not line.startswith(b'['):
+                in_movetext = True
+            offset += len(line)
+
+        if lines:
+            yield game_start, b''.join(lines).decode('utf-8', errors='replace')
+
+
+def read_records(path, record):
+    """Stream the records of a sorted run file as tuples."""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(record.size * 4096)
+            if not chunk:
+                break
+            yield from record.iter_unpack(chunk)
+
+
+def write_records(path, records, record):
+    """Write tuples to a run file."""
+    with open(path, 'wb') as f:
+        for values in records:
+            f.write(record.pack(*values))
+
+
+def merge_position_runs(runs, out_path):
+    """Merge sorted position runs, adding up the statistics of identical (key, move) entries."""
+    def merged():
+        current = None
+        for key, move, games, white, draws, black in heapq.merge(*runs):
+            if current is not None and current[0] == key and current[1] == move:
+                current[2] += games
+                current[3] += white
+                current[4] += draws
+                current[5] += black
+            else:
+                if current is not None:
+                    yield current
+                current = [key, move, games, white, draws, black]
+        if current is not None:
+            yield current
+
+    write_records(out_path, merged(), POSITION_RECORD)
+
+
+def merge_game_runs(runs, out_path):
+    """Merge sorted game-offset runs."""
+    write_records(out_path, heapq.merge(*runs), GAME_RECORD)
+
+
+class IndexBuilder:
+    """Collects positions from games in memory and spills them as sorted runs."""
+
+    def __init__(self, max_ply, run_size=RUN_SIZE):
+        self.max_ply = max_ply
+        self.run_size = run_size
+        self.tmp_dir = tempfile.mkdtemp(prefix="explorer-")
+        self.position_runs = []
+        self.game_runs = []
+        self.positions = collections.defaultdict(lambda: [0, 0, 0, 0])
+        self.games = []
+        self.game_count = 0
+
+    def add_game(self, source_id, offset, text):
+        """Index the positions of one game."""
+        game = chess.pgn.read_game(io.StringIO(text))
+        if game is None:
+            return
+        result = _RESULTS.get(game.headers.get("Result"))
+
+        board = game.board()
+        moves = list(game.mainline_moves())
+        seen = set()
+        for ply in range(min(len(moves), self.max_ply) + 1):
+            key = chess.polyglot.zobrist_hash(board)
+            # NO_MOVE marks the position the game ended in
+            next_move = encode_move(moves[ply]) if ply < len(moves) else NO_MOVE
+
+            # A game that repeats a position is only counted and listed once
+            # for it, under the move played the first time
+            if key not in seen:
+                seen.add(key)
+                stats = self.positions[(key, next_move)]
+                stats[0] += 1
+                if result is not None:
+                    stats[1 + result] += 1
+                self.games.append((key, source_id, offset))
+
+            if ply < len(moves):
+                board.push(moves[ply])
+
+        self.game_count += 1
+        if len(self.positions) + len(self.games) >= self.run_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered entries as a pair of sorted runs."""
+        if not self.positions and not self.games:
+            return
+        run = len(self.position_runs)
+        position_path = os.path.join(self.tmp_dir, f"positions-{run}")
+        game_path = os.path.join(self.tmp_dir, f"games-{run}")
+
+        records = (key + tuple(stats) for key, stats in sorted(self.positions.items()))
+        write_records(position_path, records, POSITION_RECORD)
+        self.games.sort()
+        write_records(game_path, self.games, GAME_RECORD)
+
+        self.position_runs.append(position_path)
+        self.game_runs.append(game_path)
+        self.positions.clear()
+        self.games = []
+
+    def cleanup(self):
+        for path in self.position_runs + self.game_runs:
+            os.remove(path)
+        os.rmdir(self.tmp_dir)
+
+
+class PositionIndex:
+    """Zobrist-keyed statistics and game offsets for a PGN archive, stored as sorted memory-mapped records.
+
+    An index at `path` consists of path.pos (statistics per position and next
+    move), path.games (where each position occurred) and path.sources (the PGN
+    files indexed and how far into each).
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self.sources = []
+        self.max_ply = None
+        self._maps = {}
+        if os.path.exists(self.path + ".sources"):
+            with open(self.path + ".sources") as f:
+                meta = json.load(f)
+            self.sources = meta['sources']
+            self.max_ply = meta['max_ply']
+
+    @classmethod
+    def open_if_exists(cls, path=DEFAULT_INDEX_PATH):
+        """Return the index at path, or None if nothing has been built there."""
+        if not os.path.exists(path + ".sources"):
+            return None
+        return cls(path)
+
+    def close(self):
+        for mm, f in self._maps.values():
+            mm.close()
+            f.close()
+        self._maps = {}
+
+    def _map(self, suffix):
+        """Memory-map one of the record files (None if it is empty)."""
+        if suffix not in self._maps:
+            if not os.path.exists(self.path + suffix):
+                return None
+            f = open(self.path + suffix, 'rb')
+            if os.fstat(f.fileno()).st_size == 0:
+                f.close()
+                return None
+            self._maps[suffix] = (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), f)
+        return self._maps[suffix][0]
+
+    @staticmethod
+    def _lower_bound(mm, record, key):
+        """Binary search for the first record whose leading key is >= key."""
+        lo, hi = 0, len(mm) // record.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if struct.unpack_from('<Q', mm, mid * record.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _records_for(self, suffix, record, key):
+        mm = self._map(suffix)
+        if mm is None:
+            return
+        count = len(mm) // record.size
+        i = self._lower_bound(mm, record, key)
+        while i < count:
+            values = record.unpack_from(mm, i * record.size)
+            if values[0] != key:
+                break
+            yield values
+            i += 1
+
+    def explore(self, board, max_games=10):
+        """Statistics for a position: totals, moves played next (most popular first) and sample games."""
+        key = chess.polyglot.zobrist_hash(board)
+        games = white = draws = black = 0
+        moves = []
+        for _, move, move_games, move_white, move_draws, move_black in self._records_for(".pos", POSITION_RECORD, key):
+            games += move_games
+            white += move_white
+            draws += move_draws
+            black += move_black
+            if move != NO_MOVE:
+                moves.append(MoveStats(decode_move(move), move_games, move_white, move_draws, move_black))
+        moves.sort(key=lambda stats: stats.games, reverse=True)
+
+        game_offsets = []
+        for _, source_id, offset in self._records_for(".games", GAME_RECORD, key):
+            if len(game_offsets) >= max_games:
+                break
+            game_offsets.append((self.sources[source_id]['path'], offset))
+
+        return ExploreResult(games, white, draws, black, moves, game_offsets)
+
+    def add_pgn(self, pgn_path, max_ply=40, run_size=RUN_SIZE):
+        """Index a PGN file, or just the games appended to it since it was last indexed."""
+        if self.max_ply is None:
+            self.max_ply = max_ply
+        pgn_path = os.path.abspath(pgn_path)
+
+        for source_id, source in enumerate(self.sources):
+            if source['path'] == pgn_path:
+                break
+        else:
+            source_id = len(self.sources)
+            source = {'path': pgn_path, 'indexed_bytes': 0}
+            self.sources.append(source)
+
+        builder = IndexBuilder(self.max_ply, run_size)
+        try:
+            for offset, text in iter_pgn_games(pgn_path, source['indexed_bytes']):
+                builder.add_game(source_id, offset, text)
+            builder.flush()
+            self._merge_runs(builder.position_runs, builder.game_runs)
+        finally:
+            builder.cleanup()
+
+        source['indexed_bytes'] = os.path.getsize(pgn_path)
+        self._save_sources()
+        return builder.game_count
+
+    def merge(self, other):
+        """Fold another index (e.g. built on a different machine) into this one.
+
+        Returns False if every source of other is already in this index. The
+        statistics of an index cannot be split by source, so an index that
+        only partly overlaps this one, or was built with a different max_ply,
+        raises ValueError.
+        """
+        if other.max_ply is None:
+            return False
+        if self.max_ply is not None and self.max_ply != other.max_ply:
+            raise ValueError(f"{other.path} indexes {other.max_ply} plies per game, this index {self.max_ply}")
+
+        known = {(source['path'], source['indexed_bytes']) for source in self.sources}
+        if all((source['path'], source['indexed_bytes']) in known for source in other.sources):
+            return False
+        known_paths = {source['path'] for source in self.sources}
+        overlapping = [source for source in other.sources if source['path'] in known_paths]
+        if overlapping:
+            raise ValueError(f"{other.path} shares {', '.join(source['path'] for source in overlapping)} "
+                             f"with this index; merging would count those games twice")
+
+        self.max_ply = other.max_ply
+        base = len(self.sources)
+        self.sources.extend(other.sources)
+
+        other_games = ((key, source_id + base, offset)
+                       for key, source_id, offset in read_records(other.path + ".games", GAME_RECORD))
+        self._merge_runs([other.path + ".pos"], [other_games])
+        self._save_sources()
+        return True
+
+    def _merge_runs(self, position_runs, game_runs):
+        """Merge new runs (paths or record iterators) with the existing files and swap them in."""
+        self.close()
+        position_iters = [read_records(run, POSITION_RECORD) if isinstance(run, str) else run for run in position_runs]
+        game_iters = [read_records(run, GAME_RECORD) if isinstance(run, str) else run for run in game_runs]
+        if os.path.exists(self.path + ".pos"):
+            position_iters.append(read_records(self.path + ".pos", POSITION_RECORD))
+            game_iters.append(read_records(self.path + ".games", GAME_RECORD))
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        merge_position_runs(position_iters, self.path + ".pos.tmp")
+        merge_game_runs(game_iters, self.path + ".games.tmp")
+        os.replace(self.path + ".pos.tmp", self.path + ".pos")
+        os.replace(self.path + ".games.tmp", self.path + ".games")
+
+    def _save_sources(self):
+        with open(self.path + ".sources.tmp", 'w') as f:
+            json.dump({'max_ply': self.max_ply, 'sources': self.sources}, f, indent=2)
+        os.replace(self.path + ".sources.tmp", self.path + ".sources")
+
+
+def load_game(path, offset):
+    """Read the game starting at a byte offset of a PGN file."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        text = io.TextIOWrapper(f, encoding='utf-8', errors='replace')
+        return chess.pgn.read_game(text)
+
+
+def format_explore(board, result, limit=10):
+    """Describe an explore result as lines of text."""
+    if result.games == 0:
+        return ["No games in the index reach this position."]
+
+    def percentages(stats):
+        decided = stats.white + stats.draws + stats.black
+        if decided == 0:
+            return "-"
+        return (f"{100 * stats.white // decided}% / {100 * stats.draws // decided}% / "
+                f"{100 * stats.black // decided}%")
+
+    lines = [f"{result.games} games, white/draw/black: {percentages(result)}"]
+    for stats in result.moves[:limit]:
+        lines.append(f"  {board.san(stats.move):8} {stats.games:>8} games  {percentages(stats)}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Position explorer index over PGN archives")
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help="index path (without extension)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add = subparsers.add_parser('add', help="index PGN files, or the new games appended to them")
+    add.add_argument('pgn', nargs='+')
+    add.add_argument('--max-ply', type=int, default=40, help="only index this many plies of each game")
+
+    merge = subparsers.add_parser('merge', help="merge another index into this one")
+    merge.add_argument('other')
+
+    query = subparsers.add_parser('query', help="show what was played in a position")
+    query.add_argument('fen', nargs='?', default=chess.STARTING_FEN)
+
+    args = parser.parse_args()
+    index = PositionIndex(args.index)
+
+    if args.command == 'add':
+        for pgn_path in args.pgn:
+            start = time.time()
+            count = index.add_pgn(pgn_path, args.max_ply)
+            print(f"Indexed {count} games from {pgn_path} in {time.time() - start:.1f}s")
+    elif args.command == 'merge':
+        try:
+            merged = index.merge(PositionIndex(args.other))
+        except ValueError as e:
+            print(f"Cannot merge: {e}")
+            return
+        print(f"Merged {args.other} into {args.index}" if merged else f"{args.other} is already in {args.index}")
+    else:
+        board = chess.Board(args.fen)
+        start = time.perf_counter()
+        result = index.explore(board)
+        elapsed = (time.perf_counter() - start) * 1000
+        for line in format_explore(board, result):
+            print(line)
+        for path, offset in result.game_offsets:
+            print(f"  {path} @ {offset}")
+        print(f"({elapsed:.2f} ms)")
+
+if __name__ == "__main__":
+    main()
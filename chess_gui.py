@@ -1,3 +1,4 @@
+import argparse
 import pygame
 import chess
 import sys
@@ -5,6 +6,12 @@ import time
 import random
 import os
 from pygame import gfxdraw
+from chess_history import HistoryNavigator
+from chess_mcts import MCTSEngine
+from chess_explorer import PositionIndex
+from chess_archive import GameArchive
+from chess_nnue import NNUEEvaluator
+from chess_search import Searcher
 
 # Initialize pygame
 pygame.init()
@@ -12,6 +19,10 @@ pygame.init()
 # Constants
 BOARD_SIZE = 600
 SQUARE_SIZE = BOARD_SIZE // 8
+PANEL_WIDTH = 200    # Move list to the right of the board
+STATUS_HEIGHT = 40
+MOVE_LINE_HEIGHT = 22
+PANEL_LINES = BOARD_SIZE // MOVE_LINE_HEIGHT
 FPS = 30
 
 # Colors
@@ -23,6 +34,8 @@ HIGHLIGHT = (124, 252, 0)       # Green for highlighting selected pieces
 LIGHT_MOVE_HIGHLIGHT = (247, 236, 118)  # Light yellow for highlighting possible moves on light squares
 DARK_MOVE_HIGHLIGHT = (187, 174, 60)    # Darker yellow for highlighting possible moves on dark squares
 TEXT_COLOR = (50, 50, 50)
+PANEL_COLOR = (230, 230, 230)
+CURRENT_MOVE_COLOR = (255, 255, 180)
 
 # Piece symbols (using Unicode chess symbols) - fallback if images fail to load
 PIECE_SYMBOLS = {
@@ -31,9 +44,9 @@ PIECE_SYMBOLS = {
 }
 
 class ChessGUI:
-    def __init__(self, player_color='white', difficulty='medium'):
+    def __init__(self, player_color='white', difficulty='medium', nnue_path=None):
         # Set up the display
-        self.screen = pygame.display.set_mode((BOARD_SIZE, BOARD_SIZE + 40))  # Extra space for status bar
+        self.screen = pygame.display.set_mode((BOARD_SIZE + PANEL_WIDTH, BOARD_SIZE + STATUS_HEIGHT))
         pygame.display.set_caption("Chess GUI")
         
         # Set up the clock
@@ -44,14 +57,39 @@ class ChessGUI:
         self.player_color = chess.WHITE if player_color.lower() == 'white' else chess.BLACK
         self.computer_color = not self.player_color
         self.difficulty = difficulty
+        self.move_history = []
+        self.history = HistoryNavigator()
+        
+        # Finished games are appended to the local game archive
+        self.archive = GameArchive()
+        self.start_time = time.time()
+        self.game_saved = False
+        
+        # Position explorer over a local game archive, shown instead of the move list with 'e'
+        self.explorer = PositionIndex.open_if_exists()
+        self.show_explorer = False
         
         # Set up difficulty levels (depth for move search)
         self.difficulty_levels = {
             'easy': 1,
             'medium': 2,
-            'hard': 3
+            'hard': 3,
+            'mcts': 10
         }
         
+        # Optional HalfKP network evaluation; with it the computer searches to
+        # the difficulty's depth instead of picking moves by simple rules
+        self.evaluator = None
+        if nnue_path:
+            try:
+                self.evaluator = NNUEEvaluator.load(nnue_path)
+            except (OSError, ValueError) as e:
+                print(f"Could not load network weights: {e}")
+        self.searcher = Searcher(evaluator=self.evaluator) if self.evaluator else None
+        
+        # The 'mcts' difficulty uses the built-in Monte Carlo tree search
+        self.mcts = MCTSEngine(evaluator=self.evaluator) if difficulty == 'mcts' else None
+        
         # Game state variables
         self.selected_square = None
         self.possible_moves = []
@@ -61,6 +99,14 @@ class ChessGUI:
         # Set up fonts
         self.piece_font = pygame.font.SysFont('Arial', 50)
         self.status_font = pygame.font.SysFont('Arial', 20)
+        self.label_font = pygame.font.SysFont('Arial', 12)
+        self.panel_font = pygame.font.SysFont('Arial', 16)
+        
+        # What was last drawn on each square, the status bar and the move list,
+        # so each frame only redraws the parts that changed
+        self.drawn_squares = {}
+        self.drawn_status = None
+        self.drawn_move_list = None
         
         # Load chess piece images
         self.piece_images = self.load_piece_images()
@@ -101,77 +147,147 @@ class ChessGUI:
         
         return piece_images
     
-    def draw_board(self):
-        """Draw the chess board with pieces."""
-        # Draw squares
-        for row in range(8):
-            for col in range(8):
-                # Determine base square color
-                base_color = LIGHT_SQUARE if (row + col) % 2 == 0 else DARK_SQUARE
-                
-                # Check if this square is a possible move
-                square = self.coords_to_square(col, row)
-                if square in self.possible_moves:
-                    # Use a glowing highlight color based on the base square color
-                    if (row + col) % 2 == 0:  # Light square
-                        color = LIGHT_MOVE_HIGHLIGHT
-                    else:  # Dark square
-                        color = DARK_MOVE_HIGHLIGHT
-                else:
-                    color = base_color
-                
-                # Draw the square
-                pygame.draw.rect(self.screen, color, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-                
-                # Highlight selected square
-                if self.selected_square is not None:
-                    selected_col, selected_row = self.square_to_coords(self.selected_square)
-                    if row == selected_row and col == selected_col:
-                        pygame.draw.rect(self.screen, HIGHLIGHT, 
-                                        (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-                        
-                        # Draw a border around the selected square
-                        pygame.draw.rect(self.screen, (50, 150, 50), 
-                                        (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE), 3)
-        
-        # Draw coordinate labels
-        label_font = pygame.font.SysFont('Arial', 12)
-        for i in range(8):
-            # Draw rank numbers (1-8)
-            rank_label = label_font.render(str(8 - i), True, TEXT_COLOR)
-            self.screen.blit(rank_label, (5, i * SQUARE_SIZE + 5))
+    def displayed_board(self):
+        """The board being shown: the live game, or an earlier position while browsing."""
+        return self.board if self.history.is_live() else self.history.current_board()
+    
+    def square_state(self, board, square):
+        """Everything that determines how a square looks."""
+        piece = board.piece_at(square)
+        if square == self.selected_square:
+            highlight = 'selected'
+        elif square in self.possible_moves:
+            highlight = 'move'
+        else:
+            highlight = None
+        return (piece.symbol() if piece else None, highlight)
+    
+    def draw_square(self, square, state):
+        """Draw one square, its coordinate label and its piece. Returns the area drawn."""
+        col, row = self.square_to_coords(square)
+        rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+        symbol, highlight = state
+        
+        # Determine square color
+        if highlight == 'selected':
+            color = HIGHLIGHT
+        elif highlight == 'move':
+            # Use a glowing highlight color based on the base square color
+            color = LIGHT_MOVE_HIGHLIGHT if (row + col) % 2 == 0 else DARK_MOVE_HIGHLIGHT
+        else:
+            color = LIGHT_SQUARE if (row + col) % 2 == 0 else DARK_SQUARE
+        pygame.draw.rect(self.screen, color, rect)
+        
+        # Draw a border around the selected square
+        if highlight == 'selected':
+            pygame.draw.rect(self.screen, (50, 150, 50), rect, 3)
+        
+        # Draw coordinate labels on the edge squares
+        if col == 0:
+            rank_label = self.label_font.render(str(8 - row), True, TEXT_COLOR)
+            self.screen.blit(rank_label, (5, row * SQUARE_SIZE + 5))
+        if row == 7:
+            file_label = self.label_font.render(chr(97 + col), True, TEXT_COLOR)
+            self.screen.blit(file_label, (col * SQUARE_SIZE + SQUARE_SIZE - 15, BOARD_SIZE - 15))
+        
+        if symbol:
+            # Try to use image if available
+            if symbol in self.piece_images:
+                img = self.piece_images[symbol]
+                self.screen.blit(img, img.get_rect(center=rect.center))
+            else:
+                # Fall back to text symbol
+                color = WHITE if symbol.isupper() else BLACK
+                text = self.piece_font.render(PIECE_SYMBOLS[symbol], True, color)
+                self.screen.blit(text, text.get_rect(center=rect.center))
+        
+        return rect
+    
+    def draw_move_list(self):
+        """Draw the move list panel, keeping the viewed move in sight. Returns the area drawn."""
+        rect = pygame.Rect(BOARD_SIZE, 0, PANEL_WIDTH, BOARD_SIZE)
+        pygame.draw.rect(self.screen, PANEL_COLOR, rect)
+        
+        # One line per full move; scroll so the line with the viewed ply is visible
+        current_line = max(self.history.cursor - 1, 0) // 2
+        first_line = max(0, current_line - PANEL_LINES + 1)
+        
+        for line in range(first_line, min(first_line + PANEL_LINES, (len(self.move_history) + 1) // 2)):
+            y = (line - first_line) * MOVE_LINE_HEIGHT
+            number = self.status_font.render(f"{line + 1}.", True, TEXT_COLOR)
+            self.screen.blit(number, (BOARD_SIZE + 8, y + 2))
             
-            # Draw file letters (a-h)
-            file_label = label_font.render(chr(97 + i), True, TEXT_COLOR)
-            self.screen.blit(file_label, (i * SQUARE_SIZE + SQUARE_SIZE - 15, BOARD_SIZE - 15))
-        
-        # Draw pieces
-        for row in range(8):
-            for col in range(8):
-                square = chess.square(col, 7 - row)  # Convert to chess.square (0-63)
-                piece = self.board.piece_at(square)
-                if piece:
-                    symbol = piece.symbol()
-                    
-                    # Try to use image if available
-                    if symbol in self.piece_images:
-                        img = self.piece_images[symbol]
-                        img_rect = img.get_rect(center=(col * SQUARE_SIZE + SQUARE_SIZE // 2, 
-                                                      row * SQUARE_SIZE + SQUARE_SIZE // 2))
-                        self.screen.blit(img, img_rect)
-                    else:
-                        # Fall back to text symbol
-                        text_symbol = PIECE_SYMBOLS[symbol]
-                        color = WHITE if piece.color == chess.WHITE else BLACK
-                        text = self.piece_font.render(text_symbol, True, color)
-                        text_rect = text.get_rect(center=(col * SQUARE_SIZE + SQUARE_SIZE // 2, 
-                                                        row * SQUARE_SIZE + SQUARE_SIZE // 2))
-                        self.screen.blit(text, text_rect)
+            for side in range(2):
+                ply = line * 2 + side
+                if ply >= len(self.move_history):
+                    break
+                x = BOARD_SIZE + 50 + side * 70
+                if ply + 1 == self.history.cursor:
+                    pygame.draw.rect(self.screen, CURRENT_MOVE_COLOR, (x - 3, y, 66, MOVE_LINE_HEIGHT))
+                text = self.status_font.render(self.move_history[ply], True, TEXT_COLOR)
+                self.screen.blit(text, (x, y + 2))
+        
+        return rect
+    
+    def draw_explorer_panel(self):
+        """Draw archive statistics for the displayed position. Returns the area drawn."""
+        rect = pygame.Rect(BOARD_SIZE, 0, PANEL_WIDTH, BOARD_SIZE)
+        pygame.draw.rect(self.screen, PANEL_COLOR, rect)
+        
+        if self.explorer is None:
+            lines = ["No position index.", "Build one with", "chess_explorer.py add"]
+        else:
+            board = self.displayed_board()
+            result = self.explorer.explore(board)
+            lines = [f"{result.games} games"]
+            for stats in result.moves[:PANEL_LINES - 1]:
+                decided = stats.white + stats.draws + stats.black
+                if decided:
+                    score = f"{100 * stats.white // decided}/{100 * stats.draws // decided}/{100 * stats.black // decided}"
+                else:
+                    score = "-"
+                lines.append(f"{board.san(stats.move):6} {stats.games:>6}  {score}")
+        
+        for i, line in enumerate(lines):
+            text = self.panel_font.render(line, True, TEXT_COLOR)
+            self.screen.blit(text, (BOARD_SIZE + 8, i * MOVE_LINE_HEIGHT + 4))
+        
+        return rect
+    
+    def draw_board(self):
+        """Redraw whatever changed since the last frame. Returns the list of areas drawn."""
+        board = self.displayed_board()
+        dirty = []
+        
+        # Squares whose piece or highlight changed
+        for square in chess.SQUARES:
+            state = self.square_state(board, square)
+            if self.drawn_squares.get(square) != state:
+                dirty.append(self.draw_square(square, state))
+                self.drawn_squares[square] = state
+        
+        move_list = (len(self.move_history), self.history.cursor, self.show_explorer)
+        if move_list != self.drawn_move_list:
+            if self.show_explorer:
+                dirty.append(self.draw_explorer_panel())
+            else:
+                dirty.append(self.draw_move_list())
+            self.drawn_move_list = move_list
         
         # Draw status bar
-        pygame.draw.rect(self.screen, (200, 200, 200), (0, BOARD_SIZE, BOARD_SIZE, 40))
-        status_text = self.status_font.render(self.status_message, True, TEXT_COLOR)
-        self.screen.blit(status_text, (10, BOARD_SIZE + 10))
+        if self.history.is_live():
+            status = self.status_message
+        else:
+            status = f"Viewing ply {self.history.cursor} of {len(self.history)} (Right/End to return)"
+        if status != self.drawn_status:
+            rect = pygame.Rect(0, BOARD_SIZE, BOARD_SIZE + PANEL_WIDTH, STATUS_HEIGHT)
+            pygame.draw.rect(self.screen, (200, 200, 200), rect)
+            status_text = self.status_font.render(status, True, TEXT_COLOR)
+            self.screen.blit(status_text, (10, BOARD_SIZE + 10))
+            dirty.append(rect)
+            self.drawn_status = status
+        
+        return dirty
     
     def square_to_coords(self, square):
         """Convert a chess square (0-63) to board coordinates (col, row)."""
@@ -185,7 +301,7 @@ class ChessGUI:
     
     def get_clicked_square(self, pos):
         """Convert mouse position to board square."""
-        if pos[1] >= BOARD_SIZE:  # Click is in the status bar
+        if pos[1] >= BOARD_SIZE or pos[0] >= BOARD_SIZE:  # Click is in the status bar or move list
             return None
             
         col = pos[0] // SQUARE_SIZE
@@ -198,7 +314,7 @@ class ChessGUI:
             return
             
         self.status_message = "Computer is thinking..."
-        pygame.display.flip()
+        pygame.display.update(self.draw_board())
         
         # Simulate thinking time
         time.sleep(0.5)
@@ -207,7 +323,11 @@ class ChessGUI:
         legal_moves = list(self.board.legal_moves)
         
         # Simple move selection based on difficulty
-        if self.difficulty == 'easy':
+        if self.mcts:
+            move = self.mcts.select_move(self.board, time_limit=0.1 * self.difficulty_levels[self.difficulty])
+        elif self.searcher:
+            move, _ = self.searcher.search(self.board, depth=self.difficulty_levels[self.difficulty])
+        elif self.difficulty == 'easy':
             # Random move
             move = random.choice(legal_moves)
         else:
@@ -231,8 +351,7 @@ class ChessGUI:
                 move = random.choice(legal_moves)
         
         # Make the move
-        san_move = self.board.san(move)
-        self.board.push(move)
+        san_move = self.play_move(move)
         
         # Update status message
         self.status_message = f"Computer played: {san_move}"
@@ -255,8 +374,7 @@ class ChessGUI:
         
         # Make the move if legal
         if move in self.board.legal_moves:
-            san_move = self.board.san(move)
-            self.board.push(move)
+            san_move = self.play_move(move)
             self.status_message = f"You played: {san_move}"
             
             # Check for game over
@@ -267,10 +385,33 @@ class ChessGUI:
             return True
         return False
     
+    def play_move(self, move):
+        """Push a move on the board and record it. Returns the move in SAN."""
+        san_move = self.board.san(move)
+        self.board.push(move)
+        self.move_history.append(san_move)
+        self.history.push(move)
+        return san_move
+    
+    def save_game(self):
+        """Append the game to the archive, once, if any moves were played."""
+        if self.game_saved or not self.history.moves:
+            return
+        player = "Player"
+        computer = f"Computer ({self.difficulty})"
+        white, black = (player, computer) if self.player_color == chess.WHITE else (computer, player)
+        try:
+            self.archive.append(self.history.moves, white, black, self.board.result(),
+                                self.start_time, time.time())
+            self.game_saved = True
+        except OSError as e:
+            print(f"Could not save the game: {e}")
+    
     def check_game_over(self):
         """Check if the game is over and update status message accordingly."""
         if self.board.is_game_over():
             self.game_over = True
+            self.save_game()
             
             if self.board.is_checkmate():
                 winner = "You win!" if self.board.turn != self.player_color else "Computer wins!"
@@ -299,12 +440,18 @@ class ChessGUI:
             # Handle events
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.save_game()
                     running = False
                 
                 elif event.type == pygame.KEYDOWN:
                     # Press 'r' to restart
                     if event.key == pygame.K_r:
+                        self.save_game()
                         self.board = chess.Board()
+                        self.move_history = []
+                        self.history.reset()
+                        self.start_time = time.time()
+                        self.game_saved = False
                         self.selected_square = None
                         self.possible_moves = []
                         self.game_over = False
@@ -313,6 +460,24 @@ class ChessGUI:
                         # If computer plays white, make the first move
                         if self.computer_color == chess.WHITE:
                             self.make_computer_move()
+                    
+                    # Arrow keys browse earlier positions
+                    elif event.key == pygame.K_LEFT:
+                        self.history.back()
+                    elif event.key == pygame.K_RIGHT:
+                        self.history.forward()
+                    elif event.key == pygame.K_HOME:
+                        self.history.goto(0)
+                    elif event.key == pygame.K_END:
+                        self.history.goto(len(self.history))
+                    
+                    # 'e' switches the side panel between the move list and the explorer
+                    elif event.key == pygame.K_e:
+                        self.show_explorer = not self.show_explorer
+                
+                elif event.type == pygame.MOUSEBUTTONDOWN and not self.history.is_live():
+                    # Clicking while browsing returns to the current position
+                    self.history.goto(len(self.history))
                 
                 elif event.type == pygame.MOUSEBUTTONDOWN and not self.game_over:
                     # Only allow player to move on their turn
@@ -353,11 +518,12 @@ class ChessGUI:
                                     self.selected_square = None
                                     self.possible_moves = []
             
-            # Draw the board and pieces
-            self.draw_board()
+            # Draw the parts of the board that changed
+            dirty = self.draw_board()
             
-            # Update the display
-            pygame.display.flip()
+            # Update only those parts of the display
+            if dirty:
+                pygame.display.update(dirty)
             
             # Cap the frame rate
             self.clock.tick(FPS)
@@ -366,18 +532,26 @@ class ChessGUI:
         sys.exit()
 
 def main():
+    parser = argparse.ArgumentParser(description="Play chess against the computer in a window")
+    parser.add_argument('--difficulty', choices=('easy', 'medium', 'hard', 'mcts'), default='medium',
+                        help="strength of the computer (default: medium)")
+    parser.add_argument('--nnue', help="network weights file for the computer (see chess_nnue.py)")
+    args = parser.parse_args()
+    
     # Create and start the game with default values
     print("Welcome to Chess GUI!")
-    print("\nUsing default settings:")
+    print("\nUsing settings:")
     print("- Playing as white")
-    print("- Medium difficulty")
+    print(f"- {args.difficulty.capitalize()} difficulty")
     
     # Create and start the game
-    game = ChessGUI(player_color='white', difficulty='medium')
+    game = ChessGUI(player_color='white', difficulty=args.difficulty, nnue_path=args.nnue)
     print("\nGame controls:")
     print("- Click on your pieces to select them")
     print("- Click on a highlighted square to move")
     print("- Press 'r' to restart the game")
+    print("- Use the Left/Right arrow keys (and Home/End) to browse earlier positions")
+    print("- Press 'e' to show what was played in this position in your game archive")
     print("- Close the window to quit")
     game.run()
 
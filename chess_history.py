@@ -0,0 +1,79 @@
+import chess
+
+# Plies between stored board snapshots
+SNAPSHOT_INTERVAL = 16
+
+
+class HistoryNavigator:
+    """Browses earlier positions of a game.
+
+    A copy of the board is kept every `snapshot_interval` plies, so reaching any
+    ply only means copying the nearest snapshot and replaying fewer than
+    `snapshot_interval` moves, however long the game is.
+    """
+
+    def __init__(self, start_board=None, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.snapshot_interval = snapshot_interval
+        self.reset(start_board)
+
+    def reset(self, start_board=None):
+        """Forget all moves and start again from start_board (default: the initial position)."""
+        start = start_board if start_board is not None else chess.Board()
+        self.moves = []
+        self.snapshots = [start.copy(stack=False)]  # snapshots[i] is the board after i * interval plies
+        self.cursor = 0
+
+    def __len__(self):
+        """Number of plies played."""
+        return len(self.moves)
+
+    def is_live(self):
+        """True if the viewed position is the latest one."""
+        return self.cursor == len(self.moves)
+
+    def push(self, move):
+        """Record a move played in the game. A live view follows the new move."""
+        live = self.is_live()
+        self.moves.append(move)
+
+        # Take a snapshot whenever we cross an interval boundary
+        if len(self.moves) % self.snapshot_interval == 0:
+            self.snapshots.append(self.board_at(len(self.moves)))
+
+        if live:
+            self.cursor = len(self.moves)
+
+    def pop(self):
+        """Remove the last recorded move (e.g. after an undo)."""
+        move = self.moves.pop()
+        del self.snapshots[len(self.moves) // self.snapshot_interval + 1:]
+        self.cursor = min(self.cursor, len(self.moves))
+        return move
+
+    def board_at(self, ply):
+        """Return a new board showing the position after `ply` plies."""
+        base = ply // self.snapshot_interval
+        if base >= len(self.snapshots):
+            base = len(self.snapshots) - 1
+
+        board = self.snapshots[base].copy(stack=False)
+        for move in self.moves[base * self.snapshot_interval:ply]:
+            board.push(move)
+        return board
+
+    def goto(self, ply):
+        """Move the view to `ply` (clamped to the game) and return that position."""
+        self.cursor = max(0, min(ply, len(self.moves)))
+        return self.board_at(self.cursor)
+
+    def back(self, plies=1):
+        """Step the view back and return the position."""
+        return self.goto(self.cursor - plies)
+
+    def forward(self, plies=1):
+        """Step the view forward and return the position."""
+        return self.goto(self.cursor + plies)
+
+    def current_board(self):
+        """Return the viewed position."""
+        return self.board_at(self.cursor)
@@ -0,0 +1,242 @@
+import math
+import time
+
+import chess
+import numpy as np
+
+from chess_eval import ClassicEvaluator, PIECE_VALUES, encode_move, decode_move
+
+# Centipawn scale used to squash evaluations into [-1, 1] values
+VALUE_SCALE = 400.0
+
+# No position has more legal moves than this, so an expansion never needs more room
+MAX_BRANCHING = 218
+
+UNEXPANDED = -1
+
+
+class MCTSEngine:
+    """Monte Carlo tree search with the whole tree in preallocated NumPy arrays.
+
+    Node i's children occupy the contiguous slots first_child[i] ..
+    first_child[i] + num_children[i] - 1. Values are stored from the point of
+    view of the side that made the move leading to the node. Each iteration
+    collects a batch of leaves, using virtual loss to steer the selections
+    apart, and evaluates them with one vectorized evaluator call.
+    """
+
+    def __init__(self, max_nodes=500000, batch_size=16, c_puct=1.5, virtual_loss=1.0, evaluator=None):
+        self.max_nodes = max_nodes
+        self.batch_size = batch_size
+        self.c_puct = c_puct
+        self.virtual_loss = virtual_loss
+        self.evaluator = evaluator or ClassicEvaluator()
+
+        self.visits = np.zeros(max_nodes, dtype=np.float32)
+        self.value_sum = np.zeros(max_nodes, dtype=np.float32)
+        self.prior = np.zeros(max_nodes, dtype=np.float32)
+        self.first_child = np.full(max_nodes, UNEXPANDED, dtype=np.int32)
+        self.num_children = np.zeros(max_nodes, dtype=np.int16)
+        self.move = np.zeros(max_nodes, dtype=np.uint16)
+
+        self.root_board = None
+        self.clear()
+
+    def clear(self):
+        """Discard the tree, keeping only an unexpanded root."""
+        self.size = 1
+        self.visits[0] = 0
+        self.value_sum[0] = 0
+        self.first_child[0] = UNEXPANDED
+        self.num_children[0] = 0
+        self.root_board = None
+
+    def reuse_subtree(self, board):
+        """Keep the part of the tree below the new position if we searched its ancestor."""
+        if self.root_board is None:
+            return False
+
+        old_stack = self.root_board.move_stack
+        new_stack = board.move_stack
+        if (len(new_stack) < len(old_stack) or new_stack[:len(old_stack)] != old_stack
+                or self.root_board.root().fen() != board.root().fen()):
+            return False
+
+        # Walk down the moves played since the last search
+        node = 0
+        for move in new_stack[len(old_stack):]:
+            node = self.find_child(node, move)
+            if node is None:
+                return False
+
+        self.compact(node)
+        return True
+
+    def find_child(self, node, move):
+        """Index of the child of node reached by move, or None."""
+        start = self.first_child[node]
+        if start == UNEXPANDED:
+            return None
+        children = np.nonzero(self.move[start:start + self.num_children[node]] == encode_move(move))[0]
+        return int(start + children[0]) if len(children) else None
+
+    def compact(self, new_root):
+        """Copy the subtree under new_root to the front of the arrays, making it the root."""
+        arrays = (self.visits, self.value_sum, self.prior, self.first_child, self.num_children, self.move)
+        copies = [array.copy() for array in arrays]
+        old_visits, old_value_sum, old_prior, old_first_child, old_num_children, old_move = copies
+
+        self.visits[0] = old_visits[new_root]
+        self.value_sum[0] = old_value_sum[new_root]
+        self.prior[0] = old_prior[new_root]
+        self.move[0] = old_move[new_root]
+
+        # Copy each expanded node's block of children with one slice assignment
+        queue = [(new_root, 0)]
+        size = 1
+        while queue:
+            old, new = queue.pop()
+            start = int(old_first_child[old])
+            count = int(old_num_children[old])
+            if start == UNEXPANDED:
+                self.first_child[new] = UNEXPANDED
+                self.num_children[new] = 0
+                continue
+
+            self.first_child[new] = size
+            self.num_children[new] = count
+            block = slice(size, size + count)
+            old_block = slice(start, start + count)
+            self.visits[block] = old_visits[old_block]
+            self.value_sum[block] = old_value_sum[old_block]
+            self.prior[block] = old_prior[old_block]
+            self.move[block] = old_move[old_block]
+            queue.extend((start + i, size + i) for i in range(count))
+            size += count
+
+        self.size = size
+
+    def select_child(self, node):
+        """PUCT selection among a node's children."""
+        start = self.first_child[node]
+        block = slice(start, start + self.num_children[node])
+        visits = self.visits[block]
+        q = np.where(visits > 0, self.value_sum[block] / np.maximum(visits, 1), 0.0)
+        u = self.c_puct * self.prior[block] * math.sqrt(self.visits[node] + 1) / (1 + visits)
+        return int(start + np.argmax(q + u))
+
+    def expand(self, node, board):
+        """Create children for every legal move with priors from a cheap move heuristic."""
+        moves = list(board.legal_moves)
+        start = self.size
+        count = len(moves)
+        self.first_child[node] = start
+        self.num_children[node] = count
+        self.size += count
+
+        # Prefer captures of valuable pieces and promotions
+        scores = np.zeros(count, dtype=np.float32)
+        for i, move in enumerate(moves):
+            captured = board.piece_type_at(move.to_square)
+            if captured:
+                scores[i] += PIECE_VALUES[captured] / 100.0
+            elif board.is_en_passant(move):
+                scores[i] += 1.0
+            if move.promotion:
+                scores[i] += PIECE_VALUES[move.promotion] / 100.0
+
+        priors = np.exp(scores - scores.max())
+        block = slice(start, start + count)
+        self.prior[block] = priors / priors.sum()
+        self.move[block] = [encode_move(move) for move in moves]
+        self.visits[block] = 0
+        self.value_sum[block] = 0
+        self.first_child[block] = UNEXPANDED
+        self.num_children[block] = 0
+
+    def run_batch(self, root_board):
+        """Select up to batch_size leaves, evaluate them together and back up the results."""
+        paths = []
+        boards = []
+        leaves = set()
+
+        for _ in range(self.batch_size):
+            board = root_board.copy(stack=False)
+            node = 0
+            path = [0]
+            while self.first_child[node] != UNEXPANDED and self.num_children[node] > 0:
+                node = self.select_child(node)
+                board.push(decode_move(self.move[node]))
+                path.append(node)
+
+            # Two selections reaching the same leaf means the batch has run out of variety
+            if node in leaves:
+                break
+            leaves.add(node)
+
+            # Virtual loss makes the next selection in this batch avoid the path
+            self.visits[path] += self.virtual_loss
+            self.value_sum[path] -= self.virtual_loss
+            paths.append(path)
+            boards.append(board)
+
+        # Expand non-terminal leaves, and collect the ones that need the evaluator
+        values = np.zeros(len(boards), dtype=np.float32)
+        to_evaluate = []
+        for i, (path, board) in enumerate(zip(paths, boards)):
+            outcome = board.outcome(claim_draw=False)
+            if outcome is not None:
+                # Value for the side to move at the leaf
+                values[i] = 0.0 if outcome.winner is None else -1.0
+            else:
+                if self.size + MAX_BRANCHING <= self.max_nodes:
+                    self.expand(path[-1], board)
+                to_evaluate.append(i)
+
+        if to_evaluate:
+            scores = self.evaluator.evaluate_batch([boards[i] for i in to_evaluate])
+            white_to_move = np.array([boards[i].turn == chess.WHITE for i in to_evaluate])
+            values[to_evaluate] = np.tanh(np.where(white_to_move, scores, -scores) / VALUE_SCALE)
+
+        # Back up, removing the virtual loss; the sign flips at every ply
+        for path, value in zip(paths, values):
+            self.visits[path] += 1 - self.virtual_loss
+            signs = np.where(np.arange(len(path))[::-1] % 2 == 0, -value, value)
+            self.value_sum[path] += signs + self.virtual_loss
+
+        return len(paths)
+
+    def search(self, board, time_limit=1.0, max_simulations=None):
+        """Search a position, reusing the previous tree when possible. Returns the number of simulations."""
+        if not self.reuse_subtree(board):
+            self.clear()
+        self.root_board = board.copy()
+
+        deadline = time.monotonic() + time_limit
+        simulations = 0
+        while time.monotonic() < deadline:
+            if max_simulations is not None and simulations >= max_simulations:
+                break
+            # Stop once the tree can no longer grow
+            if self.size + MAX_BRANCHING > self.max_nodes and simulations > 0:
+                break
+            simulations += self.run_batch(self.root_board)
+
+        return simulations
+
+    def best_move(self):
+        """The most visited move at the root, using the priors to break ties."""
+        start = self.first_child[0]
+        if start == UNEXPANDED or self.num_children[0] == 0:
+            return None
+        block = slice(start, start + self.num_children[0])
+        return decode_move(self.move[start + int(np.argmax(self.visits[block] + 1e-3 * self.prior[block]))])
+
+    def select_move(self, board, time_limit=1.0, max_simulations=None):
+        """Search a position and return the chosen move."""
+        self.search(board, time_limit, max_simulations)
+        move = self.best_move()
+        if move is None:
+            self.expand(0, board)
+            move = self.best_move()
+        return move
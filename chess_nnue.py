@@ -0,0 +1,347 @@
+import argparse
+import struct
+import time
+
+import chess
+import numpy as np
+
+from chess_eval import EvalCache, EVAL_CACHE_SIZE
+
+# HalfKP features: for each perspective, the perspective's king square combined
+# with the piece type, color (own or enemy) and square of every non-king piece
+PIECE_FEATURES = 10 * 64
+NUM_FEATURES = 64 * PIECE_FEATURES
+MAX_ACTIVE = 32  # non-king pieces on the board, padded with a feature whose weights are zero
+
+# Accumulators are stored in this order
+PERSPECTIVES = (chess.WHITE, chess.BLACK)
+
+# Default layer sizes: 2 x 256 accumulator -> 32 -> 32 -> 1
+L1_SIZE = 256
+L2_SIZE = 32
+L3_SIZE = 32
+
+# Quantization: activations are clipped to [0, ACTIVATION_MAX], hidden layer
+# outputs are shifted right by WEIGHT_SHIFT and the output divided by OUTPUT_SCALE
+ACTIVATION_MAX = 127
+WEIGHT_SHIFT = 6
+OUTPUT_SCALE = 16
+
+# float32 represents every integer below this exactly
+FLOAT32_EXACT = 1 << 24
+
+# Weights file: this header, then little-endian arrays in this order:
+#   feature weights int16 (NUM_FEATURES, l1), feature bias int16 (l1),
+#   hidden 1 weights int8 (l2, 2 * l1), hidden 1 bias int32 (l2),
+#   hidden 2 weights int8 (l3, l2), hidden 2 bias int32 (l3),
+#   output weights int8 (l3), output bias int32 (1)
+MAGIC = b'NNUE'
+VERSION = 1
+HEADER = struct.Struct('<4sIIII')  # magic, version, l1, l2, l3
+
+
+class Network:
+    """Quantized HalfKP network weights."""
+
+    def __init__(self, feature_weights, feature_bias, hidden1_weights, hidden1_bias, hidden2_weights,
+                 hidden2_bias, output_weights, output_bias):
+        # One extra all-zero row so padded feature lists can be summed without masking
+        self.feature_weights = np.vstack([feature_weights.astype(np.int16),
+                                          np.zeros((1, feature_weights.shape[1]), dtype=np.int16)])
+        self.feature_bias = feature_bias.astype(np.int16)
+        # Hidden layer products are sums of int8 weights times activations of at most
+        # ACTIVATION_MAX. While every such sum stays below 2**24, float32 matrix
+        # products (which use BLAS) are exact and much faster than int32 ones; wider
+        # layers fall back to int32
+        widest = max(hidden1_weights.shape[1], hidden2_weights.shape[1], output_weights.shape[0])
+        exact = widest * ACTIVATION_MAX * 128 < FLOAT32_EXACT
+        self.matmul_dtype = np.float32 if exact else np.int32
+        self.hidden1_weights = hidden1_weights.astype(self.matmul_dtype)
+        self.hidden1_bias = hidden1_bias.astype(np.int32)
+        self.hidden2_weights = hidden2_weights.astype(self.matmul_dtype)
+        self.hidden2_bias = hidden2_bias.astype(np.int32)
+        self.output_weights = output_weights.astype(self.matmul_dtype)
+        self.output_bias = int(output_bias)
+
+    @property
+    def sizes(self):
+        return self.feature_bias.shape[0], self.hidden1_bias.shape[0], self.hidden2_bias.shape[0]
+
+    def forward(self, us, them):
+        """Centipawn scores for the side to move, from accumulators of shape (..., l1)."""
+        x = _clipped(np.concatenate([us, them], axis=-1)).astype(self.matmul_dtype)
+        x = (x @ self.hidden1_weights.T).astype(np.int32) + self.hidden1_bias
+        x = _clipped(x >> WEIGHT_SHIFT).astype(self.matmul_dtype)
+        x = (x @ self.hidden2_weights.T).astype(np.int32) + self.hidden2_bias
+        x = _clipped(x >> WEIGHT_SHIFT).astype(self.matmul_dtype)
+        return ((x @ self.output_weights).astype(np.int32) + self.output_bias) // OUTPUT_SCALE
+
+
+def _clipped(x):
+    # np.clip has a much higher fixed cost than this on small arrays
+    return np.minimum(np.maximum(x, 0), ACTIVATION_MAX)
+
+
+def load_network(path):
+    """Read a network from a weights file."""
+    with open(path, 'rb') as f:
+        magic, version, l1, l2, l3 = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} NNUE weights file")
+
+        def read(dtype, shape):
+            count = int(np.prod(shape))
+            array = np.fromfile(f, dtype=dtype, count=count)
+            if array.size != count:
+                raise ValueError(f"{path} is truncated")
+            return array.reshape(shape)
+
+        return Network(read('<i2', (NUM_FEATURES, l1)), read('<i2', (l1,)),
+                       read('i1', (l2, 2 * l1)), read('<i4', (l2,)),
+                       read('i1', (l3, l2)), read('<i4', (l3,)),
+                       read('i1', (l3,)), read('<i4', (1,))[0])
+
+
+def save_network(path, network):
+    """Write a network in the format load_network reads."""
+    l1, l2, l3 = network.sizes
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, l1, l2, l3))
+        for array, dtype in ((network.feature_weights[:-1], '<i2'), (network.feature_bias, '<i2'),
+                             (network.hidden1_weights, 'i1'), (network.hidden1_bias, '<i4'),
+                             (network.hidden2_weights, 'i1'), (network.hidden2_bias, '<i4'),
+                             (network.output_weights, 'i1'), (np.array([network.output_bias]), '<i4')):
+            f.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+
+
+def random_network(l1=L1_SIZE, l2=L2_SIZE, l3=L3_SIZE, seed=0):
+    """An untrained network with small random weights, for testing and benchmarks."""
+    rng = np.random.default_rng(seed)
+    return Network(rng.integers(-8, 9, (NUM_FEATURES, l1)), rng.integers(0, 64, l1),
+                   rng.integers(-16, 17, (l2, 2 * l1)), rng.integers(-512, 512, l2),
+                   rng.integers(-16, 17, (l3, l2)), rng.integers(-512, 512, l3),
+                   rng.integers(-64, 65, l3), 0)
+
+
+def feature_index(perspective, king_square, piece_type, color, square):
+    """HalfKP feature of a non-king piece seen from perspective, whose king is on king_square."""
+    if perspective == chess.BLACK:
+        king_square ^= 56
+        square ^= 56
+    return king_square * PIECE_FEATURES + ((piece_type - 1) * 2 + (color != perspective)) * 64 + square
+
+
+def active_features(board, perspective):
+    """Feature indices of every non-king piece on the board, seen from perspective."""
+    king_square = board.king(perspective)
+    return [feature_index(perspective, king_square, piece_type, color, square)
+            for color in chess.COLORS
+            for piece_type in (chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN)
+            for square in chess.scan_forward(board.pieces_mask(piece_type, color))]
+
+
+class NNUEEvaluator:
+    """HalfKP network evaluation with incrementally updated accumulators.
+
+    Scores are in centipawns from White's point of view, like ClassicEvaluator.
+    After set_position(board), calling push(board, move) before each move and
+    pop() after each undo keeps a stack of accumulators in step with the board.
+    Accumulators are only brought up to date when a position is evaluated, by
+    adding and subtracting the weight rows of the pieces that moved; a king
+    move refreshes that side's accumulator from scratch. Without a position
+    set, every evaluation is computed from scratch.
+    """
+
+    def __init__(self, network, eval_cache_size=EVAL_CACHE_SIZE):
+        self.network = network
+        self.eval_cache = EvalCache(eval_cache_size)
+        # Each entry: [accumulators per perspective (white, black) or None if not yet computed,
+        #              (added, removed) features per perspective, or None where a refresh is needed]
+        self.stack = []
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        return cls(load_network(path), **kwargs)
+
+    def refresh(self, board, perspective):
+        weights = self.network.feature_weights
+        return self.network.feature_bias + weights[active_features(board, perspective)].sum(axis=0, dtype=np.int16)
+
+    def set_position(self, board):
+        """Start tracking board incrementally."""
+        self.stack = [[[None, None], [None, None]]]
+
+    def clear_position(self):
+        """Stop tracking; later evaluations are computed from scratch."""
+        self.stack = []
+
+    def push(self, board, move):
+        """Record the feature changes of move; call before pushing it on board."""
+        turn = board.turn
+        piece_type = board.piece_type_at(move.from_square)
+        changes = []  # (added?, piece type, color, square) of non-king pieces
+        refresh = [False, False]
+
+        if piece_type == chess.KING:
+            refresh[0 if turn == chess.WHITE else 1] = True
+            if board.is_castling(move):
+                rank_start = move.from_square & ~7
+                if board.is_kingside_castling(move):
+                    rook_from, rook_to = rank_start + 7, rank_start + 5
+                else:
+                    rook_from, rook_to = rank_start, rank_start + 3
+                changes += [(False, chess.ROOK, turn, rook_from), (True, chess.ROOK, turn, rook_to)]
+        else:
+            changes += [(False, piece_type, turn, move.from_square),
+                        (True, move.promotion or piece_type, turn, move.to_square)]
+            if board.is_en_passant(move):
+                changes.append((False, chess.PAWN, not turn, move.to_square - 8 if turn == chess.WHITE
+                                else move.to_square + 8))
+        captured = board.piece_type_at(move.to_square)
+        if captured and not board.is_castling(move):
+            changes.append((False, captured, not turn, move.to_square))
+
+        deltas = [None, None]
+        for p, perspective in enumerate(PERSPECTIVES):
+            if not refresh[p]:
+                king_square = board.king(perspective)
+                added = [feature_index(perspective, king_square, t, c, s) for is_added, t, c, s in changes if is_added]
+                removed = [feature_index(perspective, king_square, t, c, s)
+                           for is_added, t, c, s in changes if not is_added]
+                deltas[p] = (added, removed)
+        self.stack.append([[None, None], deltas])
+
+    def pop(self):
+        """Undo the last push; call after popping the move from the board."""
+        self.stack.pop()
+
+    def accumulators(self, board):
+        """Bring the top of the stack up to date for board and return its (white, black) accumulators."""
+        weights = self.network.feature_weights
+        top = len(self.stack) - 1
+        for p, perspective in enumerate(PERSPECTIVES):
+            if self.stack[top][0][p] is not None:
+                continue
+            # Walk back to the nearest computed accumulator, stopping at any refresh
+            i = top
+            while self.stack[i][0][p] is None and self.stack[i][1][p] is not None:
+                i -= 1
+            if self.stack[i][0][p] is None:
+                self.stack[top][0][p] = self.refresh(board, perspective)
+                continue
+            accumulator = self.stack[i][0][p]
+            for entry in self.stack[i + 1:top + 1]:
+                added, removed = entry[1][p]
+                accumulator = accumulator.copy()
+                for feature in added:
+                    accumulator += weights[feature]
+                for feature in removed:
+                    accumulator -= weights[feature]
+                entry[0][p] = accumulator
+        return self.stack[top][0]
+
+    def evaluate(self, board, key=None):
+        """Score a single board; key is its Zobrist hash, if the caller has it."""
+        if key is not None:
+            score = self.eval_cache.probe(key)
+            if score is not None:
+                return score
+
+        if self.stack:
+            white, black = self.accumulators(board)
+        else:
+            white, black = self.refresh(board, chess.WHITE), self.refresh(board, chess.BLACK)
+        if board.turn == chess.WHITE:
+            score = int(self.network.forward(white, black))
+        else:
+            score = -int(self.network.forward(black, white))
+
+        if key is not None:
+            self.eval_cache.store(key, score)
+        return score
+
+    def evaluate_batch(self, boards):
+        """Score a list of boards at once, building each accumulator from scratch."""
+        if not boards:
+            return np.zeros(0, dtype=np.int32)
+        padding = NUM_FEATURES  # index of the all-zero row
+        features = np.full((len(boards), 2, MAX_ACTIVE), padding, dtype=np.int64)
+        for i, board in enumerate(boards):
+            for p, perspective in enumerate(PERSPECTIVES):
+                active = active_features(board, perspective)
+                features[i, p, :len(active)] = active
+        accumulators = self.network.feature_bias + \
+            self.network.feature_weights[features].sum(axis=2, dtype=np.int16)
+
+        white_to_move = np.array([board.turn == chess.WHITE for board in boards])
+        us = np.where(white_to_move[:, None], accumulators[:, 0], accumulators[:, 1])
+        them = np.where(white_to_move[:, None], accumulators[:, 1], accumulators[:, 0])
+        scores = self.network.forward(us, them)
+        return np.where(white_to_move, scores, -scores).astype(np.int32)
+
+    def reset_stats(self):
+        self.eval_cache.hits = self.eval_cache.misses = 0
+
+    def stats(self):
+        """Hit and miss counters of the evaluation cache."""
+        return {'eval cache': (self.eval_cache.hits, self.eval_cache.misses)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HalfKP network evaluator")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    random_parser = subparsers.add_parser('random', help="write an untrained network (for testing)")
+    random_parser.add_argument('output')
+    random_parser.add_argument('--seed', type=int, default=0)
+    bench = subparsers.add_parser('bench', help="time incremental, from-scratch and batch evaluation")
+    bench.add_argument('weights')
+    bench.add_argument('--plies', type=int, default=300)
+    args = parser.parse_args()
+
+    if args.command == 'random':
+        save_network(args.output, random_network(seed=args.seed))
+        print(f"Wrote an untrained network to {args.output}")
+        return
+
+    evaluator = NNUEEvaluator.load(args.weights, eval_cache_size=1)
+
+    # Play a fixed pseudo-random game (restarting when it ends) and time
+    # evaluating every position along it, with and without incremental updates
+    moves = []
+    board = chess.Board()
+    while len(moves) < args.plies and not board.is_game_over():
+        legal = list(board.legal_moves)
+        moves.append(legal[len(moves) * 7919 % len(legal)])
+        board.push(moves[-1])
+
+    def replay(incremental):
+        board = chess.Board()
+        if incremental:
+            evaluator.set_position(board)
+        else:
+            evaluator.clear_position()
+        start = time.perf_counter()
+        for move in moves:
+            if incremental:
+                evaluator.push(board, move)
+            board.push(move)
+            evaluator.evaluate(board)
+        return time.perf_counter() - start
+
+    incremental = replay(True)
+    scratch = replay(False)
+
+    boards = []
+    board = chess.Board()
+    for move in moves:
+        board.push(move)
+        boards.append(board.copy(stack=False))
+    start = time.perf_counter()
+    evaluator.evaluate_batch(boards)
+    batch = time.perf_counter() - start
+
+    for name, elapsed in (("incremental", incremental), ("from scratch", scratch), ("batch", batch)):
+        print(f"{name:>12}: {len(boards) / elapsed:8.0f} evaluations/s")
+
+if __name__ == "__main__":
+    main()
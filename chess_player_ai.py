@@ -1,3 +1,5 @@
+import argparse
+import shlex
 import chess
 import chess.engine
 import chess.svg
@@ -6,41 +8,73 @@ import time
 import os
 import platform
 from IPython.display import display, SVG
+from chess_history import HistoryNavigator
+from chess_mcts import MCTSEngine
+from chess_explorer import PositionIndex, format_explore
+from chess_archive import GameArchive
+from chess_nnue import NNUEEvaluator
+from chess_search import Searcher
 
 class ChessGame:
-    def __init__(self, player_color='white', difficulty='medium'):
+    def __init__(self, player_color='white', difficulty='medium', engine_command=None, nnue_path=None):
         self.board = chess.Board()
         self.player_color = chess.WHITE if player_color.lower() == 'white' else chess.BLACK
         self.computer_color = not self.player_color
         self.difficulty = difficulty
         self.move_history = []
+        self.history = HistoryNavigator()
+        
+        # Finished games are appended to the local game archive
+        self.archive = GameArchive()
+        self.start_time = time.time()
+        self.game_saved = False
+        
+        # Position explorer over a local game archive, if one has been indexed
+        self.explorer = PositionIndex.open_if_exists()
         
         # Set up difficulty levels (depth for engine search)
         self.difficulty_levels = {
             'easy': 1,
             'medium': 2,
-            'hard': 3
+            'hard': 3,
+            'mcts': 10
         }
         
-        # Try to load Stockfish engine if available
+        # Optional HalfKP network evaluation; with it the built-in engines play
+        # instead of Stockfish, searching to the difficulty's depth
+        self.evaluator = None
+        if nnue_path:
+            try:
+                self.evaluator = NNUEEvaluator.load(nnue_path)
+            except (OSError, ValueError) as e:
+                print(f"Could not load network weights: {e}")
+        self.searcher = Searcher(evaluator=self.evaluator) if self.evaluator else None
+        
+        # The 'mcts' difficulty uses the built-in Monte Carlo tree search
+        self.mcts = MCTSEngine(evaluator=self.evaluator) if difficulty == 'mcts' else None
+        
+        # Try to load Stockfish (or the UCI engine given by engine_command) if available
         self.engine = None
         try:
-            if platform.system() == "Windows":
+            if engine_command:
+                self.engine = chess.engine.SimpleEngine.popen_uci(shlex.split(engine_command))
+            elif platform.system() == "Windows":
                 stockfish_path = "stockfish/stockfish-windows-x86-64-avx2.exe"
             elif platform.system() == "Linux":
                 stockfish_path = "stockfish/stockfish-ubuntu-x86-64-avx2"
             elif platform.system() == "Darwin":  # macOS
                 stockfish_path = "stockfish/stockfish-macos-x86-64-modern"
             
-            if os.path.exists(stockfish_path):
+            if not self.engine and os.path.exists(stockfish_path):
                 self.engine = chess.engine.SimpleEngine.popen_uci(stockfish_path)
         except Exception as e:
             print(f"Stockfish engine not available: {e}")
             print("Using random move selection for computer.")
     
     def display_board(self):
-        """Clear the console and display the current board state."""
+        """Clear the console and display the current (or browsed) board state."""
         os.system('cls' if os.name == 'nt' else 'clear')
+        board = self.board if self.history.is_live() else self.history.current_board()
         
         # Print the board in ASCII format
         print("\n  a b c d e f g h")
@@ -52,7 +86,7 @@ class ChessGame:
             
             for j in range(8):
                 square = chess.square(j, 7 - i)
-                piece = self.board.piece_at(square)
+                piece = board.piece_at(square)
                 
                 if piece is None:
                     # Use different background for alternating squares
@@ -74,17 +108,21 @@ class ChessGame:
         print("  a b c d e f g h\n")
         
         # Display game status
-        if self.board.is_checkmate():
+        if board.is_checkmate():
             print("Checkmate!")
-        elif self.board.is_stalemate():
+        elif board.is_stalemate():
             print("Stalemate!")
-        elif self.board.is_check():
+        elif board.is_check():
             print("Check!")
             
         # Show whose turn it is
-        turn = "White" if self.board.turn == chess.WHITE else "Black"
+        turn = "White" if board.turn == chess.WHITE else "Black"
         print(f"{turn} to move")
         
+        if not self.history.is_live():
+            print(f"Viewing position after ply {self.history.cursor} of {len(self.history)} "
+                  "('forward', 'goto N' or 'live' to return)")
+        
         # Show move history
         if self.move_history:
             print("\nMove history:")
@@ -96,6 +134,57 @@ class ChessGame:
             if len(self.move_history) % 2 != 0:
                 print()
     
+    def play_move(self, move):
+        """Push a move on the board and record it. Returns the move in SAN."""
+        san_move = self.board.san(move)
+        self.board.push(move)
+        self.move_history.append(san_move)
+        
+        # Moving always brings the view back to the live position
+        self.history.goto(len(self.history))
+        self.history.push(move)
+        return san_move
+    
+    def browse_history(self, command):
+        """Handle the back, forward, live and goto N commands."""
+        if command == 'back':
+            self.history.back()
+        elif command == 'forward':
+            self.history.forward()
+        elif command == 'live':
+            self.history.goto(len(self.history))
+        else:
+            try:
+                self.history.goto(int(command.split()[1]))
+            except (IndexError, ValueError):
+                print("Usage: goto N, where N is the number of plies from the start.")
+                return
+        self.display_board()
+    
+    def save_game(self):
+        """Append the game to the archive, once, if any moves were played."""
+        if self.game_saved or not self.history.moves:
+            return
+        player = "Player"
+        computer = f"Computer ({self.difficulty})"
+        white, black = (player, computer) if self.player_color == chess.WHITE else (computer, player)
+        try:
+            self.archive.append(self.history.moves, white, black, self.board.result(),
+                                self.start_time, time.time())
+            self.game_saved = True
+        except OSError as e:
+            print(f"Could not save the game: {e}")
+    
+    def show_explorer(self):
+        """Print archive statistics for the displayed position."""
+        if self.explorer is None:
+            print("No position index found. Build one with: python chess_explorer.py add games.pgn")
+            return
+        board = self.board if self.history.is_live() else self.history.current_board()
+        print()
+        for line in format_explore(board, self.explorer.explore(board)):
+            print(line)
+    
     def get_player_move(self):
         """Get a move from the player."""
         while True:
@@ -110,6 +199,11 @@ class ChessGame:
                     print("  undo     - Take back the last move")
                     print("  moves    - Show legal moves")
                     print("  restart  - Start a new game")
+                    print("  back     - View the previous position")
+                    print("  forward  - View the next position")
+                    print("  goto N   - View the position after N plies (0 = start)")
+                    print("  live     - Return to the current position")
+                    print("  explore  - Show what was played from this position in the game archive")
                     continue
                 elif move_uci.lower() == 'quit':
                     return 'quit'
@@ -119,6 +213,8 @@ class ChessGame:
                         self.board.pop()  # Remove player's move
                         self.move_history.pop()  # Remove from history
                         self.move_history.pop()  # Remove from history
+                        self.history.pop()
+                        self.history.pop()
                         self.display_board()
                     else:
                         print("Cannot undo at the beginning of the game.")
@@ -129,9 +225,19 @@ class ChessGame:
                     for move in legal_moves:
                         print(f"  {move.uci()} ({self.board.san(move)})")
                     continue
+                elif move_uci.lower() in ('back', 'forward', 'live') or move_uci.lower().startswith('goto'):
+                    self.browse_history(move_uci.lower())
+                    continue
+                elif move_uci.lower() == 'explore':
+                    self.show_explorer()
+                    continue
                 elif move_uci.lower() == 'restart':
+                    self.save_game()
                     self.board = chess.Board()
                     self.move_history = []
+                    self.history.reset()
+                    self.start_time = time.time()
+                    self.game_saved = False
                     self.display_board()
                     if self.computer_color == chess.WHITE:
                         return 'computer_turn'
@@ -158,9 +264,7 @@ class ChessGame:
                 
                 # Check if the move is legal
                 if move in self.board.legal_moves:
-                    san_move = self.board.san(move)
-                    self.board.push(move)
-                    self.move_history.append(san_move)
+                    self.play_move(move)
                     return move
                 else:
                     print("Illegal move. Try again.")
@@ -169,22 +273,34 @@ class ChessGame:
             except IndexError:
                 print("Invalid square. Use algebraic notation (e.g., 'e2e4').")
     
-    def get_computer_move(self):
-        """Generate a move for the computer based on difficulty."""
+    def select_computer_move(self, board=None):
+        """Choose the computer's move for a board without playing it."""
+        if board is None:
+            board = self.board
+        
+        if self.mcts:
+            return self.mcts.select_move(board, time_limit=0.1 * self.difficulty_levels[self.difficulty])
+        
+        if self.searcher:
+            move, _ = self.searcher.search(board, depth=self.difficulty_levels[self.difficulty])
+            return move
+        
         if self.engine:
             # Use Stockfish engine with time limit based on difficulty
             time_limit = chess.engine.Limit(time=0.1 * self.difficulty_levels[self.difficulty])
-            result = self.engine.play(self.board, time_limit)
-            move = result.move
-        else:
-            # Fallback to random legal moves if no engine is available
-            legal_moves = list(self.board.legal_moves)
-            move = random.choice(legal_moves)
+            result = self.engine.play(board, time_limit)
+            return result.move
+        
+        # Fallback to random legal moves if no engine is available
+        legal_moves = list(board.legal_moves)
+        return random.choice(legal_moves)
+    
+    def get_computer_move(self):
+        """Generate a move for the computer based on difficulty."""
+        move = self.select_computer_move()
         
         # Make the move and add to history
-        san_move = self.board.san(move)
-        self.board.push(move)
-        self.move_history.append(san_move)
+        san_move = self.play_move(move)
         
         # Show the computer's move
         print(f"Computer plays: {move.uci()} ({san_move})")
@@ -241,12 +357,19 @@ class ChessGame:
                     print("Game over!")
         
         # Clean up
+        self.save_game()
         if self.engine:
             self.engine.quit()
         
         print("Thanks for playing!")
 
 def main():
+    parser = argparse.ArgumentParser(description="Play chess against the computer")
+    parser.add_argument('--engine', help="command line of a UCI engine to use instead of Stockfish, "
+                                         "e.g. 'python chess_uci.py'")
+    parser.add_argument('--nnue', help="network weights file for the built-in engines (see chess_nnue.py)")
+    args = parser.parse_args()
+    
     # Get player preferences
     print("Welcome to Chess Player AI!")
     
@@ -257,13 +380,13 @@ def main():
         print("Please enter 'white' or 'black'.")
     
     while True:
-        difficulty = input("Select difficulty (easy/medium/hard): ").lower()
-        if difficulty in ['easy', 'medium', 'hard']:
+        difficulty = input("Select difficulty (easy/medium/hard/mcts): ").lower()
+        if difficulty in ['easy', 'medium', 'hard', 'mcts']:
             break
-        print("Please enter 'easy', 'medium', or 'hard'.")
+        print("Please enter 'easy', 'medium', 'hard', or 'mcts'.")
     
     # Create and start the game
-    game = ChessGame(player_color=color, difficulty=difficulty)
+    game = ChessGame(player_color=color, difficulty=difficulty, engine_command=args.engine, nnue_path=args.nnue)
     game.play()
 
 if __name__ == "__main__":
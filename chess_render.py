@@ -0,0 +1,296 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import re
+import struct
+import time
+import zlib
+
+import chess
+import chess.pgn
+import chess.svg
+
+from chess_archive import GameArchive
+
+# Piece images next to this file, so exports work from any directory
+PIECES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pieces")
+
+# Same palette as the GUI
+LIGHT_SQUARE = (240, 217, 181)
+DARK_SQUARE = (181, 136, 99)
+LAST_MOVE_LIGHT = (247, 236, 118)
+LAST_MOVE_DARK = (187, 174, 60)
+
+# Image file prefix of each python-chess piece symbol
+PIECE_FILES = {
+    'P': 'wP', 'N': 'wN', 'B': 'wB', 'R': 'wR', 'Q': 'wQ', 'K': 'wK',
+    'p': 'bP', 'n': 'bN', 'b': 'bB', 'r': 'bR', 'q': 'bQ', 'k': 'bK'
+}
+
+# SVG boards are drawn in the 45-unit squares the piece drawings use
+SVG_UNIT = 45
+
+# Positions are handed to the render workers in chunks of this many
+CHUNK_SIZE = 64
+
+# zlib level for PNG output: level 1 encodes about 2.5x faster than pygame's own
+# PNG writer for files about 15% larger, a good trade for thumbnails
+PNG_COMPRESSION = 1
+
+
+def _hex(color):
+    return "#%02x%02x%02x" % color
+
+
+def _square_origin(square, unit):
+    """Top-left corner of a square, White at the bottom."""
+    return chess.square_file(square) * unit, (7 - chess.square_rank(square)) * unit
+
+
+class SvgRenderer:
+    """Renders boards as standalone SVG documents from cached text fragments.
+
+    The 64 background squares, the piece drawings (from pieces/*.svg, or
+    python-chess's built-in ones where a file is missing) and every
+    piece-on-square and highlight element are built once, so an image is a
+    join of about 40 cached strings.
+    """
+
+    def __init__(self, size=360, pieces_dir=PIECES_DIR):
+        self.size = size
+        board_units = 8 * SVG_UNIT
+        self.header = (f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                       f'width="{size}" height="{size}" viewBox="0 0 {board_units} {board_units}">')
+        self.background = "".join(self.square_fragment(square, LIGHT_SQUARE, DARK_SQUARE)
+                                  for square in chess.SQUARES)
+        self.highlights = [self.square_fragment(square, LAST_MOVE_LIGHT, LAST_MOVE_DARK) for square in chess.SQUARES]
+        self.definitions = {symbol: self.piece_definition(symbol, pieces_dir) for symbol in PIECE_FILES}
+        self.placements = {
+            symbol: [f'<use href="#{PIECE_FILES[symbol]}" xlink:href="#{PIECE_FILES[symbol]}" x="{x}" y="{y}"/>'
+                     for x, y in (_square_origin(square, SVG_UNIT) for square in chess.SQUARES)]
+            for symbol in PIECE_FILES
+        }
+
+    @staticmethod
+    def square_fragment(square, light, dark):
+        x, y = _square_origin(square, SVG_UNIT)
+        color = light if (chess.square_file(square) + chess.square_rank(square)) % 2 else dark
+        return f'<rect x="{x}" y="{y}" width="{SVG_UNIT}" height="{SVG_UNIT}" fill="{_hex(color)}"/>'
+
+    @staticmethod
+    def piece_definition(symbol, pieces_dir):
+        """A <g> element drawing the piece in a 45x45 box, with the piece's file prefix as id."""
+        path = os.path.join(pieces_dir, f"{PIECE_FILES[symbol]}.svg")
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                document = f.read()
+            match = re.search(r'<svg\b[^>]*>(.*)</svg>', document, re.S)
+            if match:
+                return f'<g id="{PIECE_FILES[symbol]}">{match.group(1).strip()}</g>'
+        # python-chess ships the same (Cburnett) drawings
+        return re.sub(r'id="[^"]*"', f'id="{PIECE_FILES[symbol]}"', chess.svg.PIECES[symbol], count=1)
+
+    def render(self, board, last_move=None):
+        """SVG text for a board (a chess.BaseBoard or anything with piece_map())."""
+        pieces = board.piece_map()
+        parts = [self.header, "<defs>"]
+        parts.extend(self.definitions[symbol] for symbol in sorted({piece.symbol() for piece in pieces.values()}))
+        parts.append("</defs>")
+        parts.append(self.background)
+        if last_move is not None:
+            parts.append(self.highlights[last_move.from_square])
+            parts.append(self.highlights[last_move.to_square])
+        parts.extend(self.placements[piece.symbol()][square] for square, piece in pieces.items())
+        parts.append("</svg>")
+        return "".join(parts)
+
+    def save(self, board, path, last_move=None):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.render(board, last_move))
+
+
+class PngRenderer:
+    """Renders boards to PNG with pygame, headless, by blitting cached surfaces.
+
+    The background board, the last-move highlight squares and the scaled
+    piece images (from pieces/*.png) are prepared once per renderer.
+    """
+
+    def __init__(self, size=400, pieces_dir=PIECES_DIR):
+        # No window is ever opened; the dummy driver lets pygame run without a display.
+        # SDL's own signal handlers would swallow the SIGTERM the process pool stops
+        # its workers with
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_NO_SIGNAL_HANDLERS', '1')
+        os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+        import pygame
+        self.pygame = pygame
+        # pygame.image.tobytes is new in pygame 2.1.3; older versions only have tostring
+        self.surface_bytes = getattr(pygame.image, 'tobytes', None) or pygame.image.tostring
+        pygame.init()
+        # A (hidden) display mode lets surfaces be converted to its pixel format,
+        # which makes blitting several times faster
+        if pygame.display.get_surface() is None:
+            pygame.display.set_mode((1, 1))
+
+        self.size = size
+        self.square_size = size // 8
+        self.background = pygame.Surface((self.square_size * 8, self.square_size * 8)).convert()
+        for square in chess.SQUARES:
+            self.background.fill(self.square_color(square, LIGHT_SQUARE, DARK_SQUARE), self.square_rect(square))
+        self.highlight_colors = [self.square_color(square, LAST_MOVE_LIGHT, LAST_MOVE_DARK)
+                                 for square in chess.SQUARES]
+        self.pieces = {symbol: self.piece_surface(symbol, pieces_dir) for symbol in PIECE_FILES}
+
+    @staticmethod
+    def square_color(square, light, dark):
+        return light if (chess.square_file(square) + chess.square_rank(square)) % 2 else dark
+
+    def square_rect(self, square):
+        x, y = _square_origin(square, self.square_size)
+        return self.pygame.Rect(x, y, self.square_size, self.square_size)
+
+    def piece_surface(self, symbol, pieces_dir):
+        pygame = self.pygame
+        path = os.path.join(pieces_dir, f"{PIECE_FILES[symbol]}.png")
+        if os.path.exists(path):
+            image = pygame.image.load(path).convert_alpha()
+            return pygame.transform.smoothscale(image, (self.square_size, self.square_size))
+        # Without an image, draw the piece letter like the GUI does
+        font = pygame.font.SysFont('Arial', self.square_size * 3 // 4, bold=True)
+        color = (255, 255, 255) if symbol.isupper() else (0, 0, 0)
+        text = font.render(symbol.upper(), True, color)
+        surface = pygame.Surface((self.square_size, self.square_size), pygame.SRCALPHA).convert_alpha()
+        surface.blit(text, text.get_rect(center=surface.get_rect().center))
+        return surface
+
+    def render(self, board, last_move=None):
+        """A pygame Surface showing the board."""
+        surface = self.background.copy()
+        if last_move is not None:
+            for square in (last_move.from_square, last_move.to_square):
+                surface.fill(self.highlight_colors[square], self.square_rect(square))
+        surface.blits([(self.pieces[piece.symbol()], _square_origin(square, self.square_size))
+                       for square, piece in board.piece_map().items()], doreturn=False)
+        return surface
+
+    def save(self, board, path, last_move=None):
+        surface = self.render(board, last_move)
+        width, height = surface.get_size()
+        pixels = self.surface_bytes(surface, 'RGB')
+        stride = width * 3
+        # Every row starts with filter type 0 (none)
+        rows = b"".join(b"\x00" + pixels[y * stride:(y + 1) * stride] for y in range(height))
+        with open(path, 'wb') as f:
+            f.write(png_bytes(width, height, zlib.compress(rows, PNG_COMPRESSION)))
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def png_bytes(width, height, compressed_rows):
+    """A complete 8-bit RGB PNG file around already compressed scanlines."""
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + _png_chunk(b'IHDR', header) + _png_chunk(b'IDAT', compressed_rows)
+            + _png_chunk(b'IEND', b''))
+
+
+def make_renderer(image_format, size, pieces_dir=PIECES_DIR):
+    if image_format == 'svg':
+        return SvgRenderer(size, pieces_dir)
+    if image_format == 'png':
+        return PngRenderer(size, pieces_dir)
+    raise ValueError(f"unknown image format: {image_format}")
+
+
+def iter_games(path):
+    """Yield (starting board, moves) for every game in a PGN file or a game archive (.cga)."""
+    if path.endswith('.cga'):
+        for game in GameArchive(path):
+            yield (chess.Board(game.fen) if game.fen else chess.Board()), game.moves
+        return
+    with open(path, encoding='utf-8', errors='replace') as f:
+        while True:
+            game = chess.pgn.read_game(f)
+            if game is None:
+                break
+            yield game.board(), list(game.mainline_moves())
+
+
+def iter_positions(path, final_only=False):
+    """Yield (image name, board FEN, last move in UCI or None) for the positions of each game."""
+    for game_number, (board, moves) in enumerate(iter_games(path)):
+        if final_only:
+            for move in moves:
+                board.push(move)
+            yield f"game{game_number:05d}", board.board_fen(), moves[-1].uci() if moves else None
+            continue
+        yield f"game{game_number:05d}_ply000", board.board_fen(), None
+        for ply, move in enumerate(moves, start=1):
+            board.push(move)
+            yield f"game{game_number:05d}_ply{ply:03d}", board.board_fen(), move.uci()
+
+
+_renderer = None
+
+
+def _init_worker(image_format, size, pieces_dir):
+    """Pool initializer: build this worker's renderer (and its cached fragments) once."""
+    global _renderer
+    _renderer = make_renderer(image_format, size, pieces_dir)
+
+
+def _render_chunk(args):
+    """Pool worker: render a chunk of positions and return the paths written."""
+    output_dir, extension, positions = args
+    paths = []
+    for name, board_fen, last_move in positions:
+        path = os.path.join(output_dir, f"{name}.{extension}")
+        _renderer.save(chess.BaseBoard(board_fen), path, chess.Move.from_uci(last_move) if last_move else None)
+        paths.append(path)
+    return paths
+
+
+def export_images(path, output_dir, image_format='svg', size=None, final_only=False, workers=None,
+                  pieces_dir=PIECES_DIR, chunk_size=CHUNK_SIZE):
+    """Render the positions of every game in a PGN file or archive across a process pool.
+
+    Yields the path of each image as soon as the chunk holding it has been written.
+    """
+    size = size or (360 if image_format == 'svg' else 400)
+    os.makedirs(output_dir, exist_ok=True)
+    positions = iter_positions(path, final_only)
+    chunks = iter(lambda: list(itertools.islice(positions, chunk_size)), [])
+    jobs = ((output_dir, image_format, chunk) for chunk in chunks)
+
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(image_format, size, pieces_dir)) as pool:
+        for paths in pool.imap_unordered(_render_chunk, jobs):
+            yield from paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export board images from a PGN file or game archive")
+    parser.add_argument('source', help="PGN file, or game archive (.cga)")
+    parser.add_argument('--output', default="images", help="directory the images are written to")
+    parser.add_argument('--format', choices=('svg', 'png'), default='svg')
+    parser.add_argument('--size', type=int, help="image width and height in pixels")
+    parser.add_argument('--final-only', action='store_true', help="only the final position of each game")
+    parser.add_argument('--workers', type=int, help="render processes (default: one per CPU)")
+    parser.add_argument('--quiet', action='store_true', help="don't list files as they are written")
+    args = parser.parse_args()
+
+    start = time.time()
+    count = 0
+    for image_path in export_images(args.source, args.output, args.format, args.size, args.final_only,
+                                    args.workers):
+        count += 1
+        if not args.quiet:
+            print(image_path)
+    elapsed = time.time() - start
+    print(f"Rendered {count} images in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} images/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+import time
+
+import chess
+import chess.polyglot
+import numpy as np
+
+from chess_eval import ClassicEvaluator, PIECE_VALUES
+
+MATE_SCORE = 100000
+MAX_DEPTH = 64
+
+# Transposition table entry bounds
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Rough size of one transposition table entry in bytes, used to honour a Hash size in MB
+TT_ENTRY_BYTES = 200
+
+# How often (in nodes) the search checks its time, node and stop limits
+CHECK_INTERVAL = 1024
+
+
+_RANDOM = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+_HASHER = chess.polyglot.ZobristHasher(_RANDOM)
+_TURN_KEY = _RANDOM[780]
+
+
+def _piece_key(piece_type, color, square):
+    return _RANDOM[64 * ((piece_type - 1) * 2 + int(color)) + square]
+
+
+def _castling_key(castling_rights):
+    """Zobrist contribution of a standard-chess castling rights mask."""
+    key = 0
+    for i, rook_square in enumerate((chess.H1, chess.A1, chess.H8, chess.A8)):
+        if castling_rights & chess.BB_SQUARES[rook_square]:
+            key ^= _RANDOM[768 + i]
+    return key
+
+
+def push_with_key(board, move, key):
+    """Push a move and return the board's updated polyglot Zobrist key.
+
+    Equivalent to chess.polyglot.zobrist_hash(board) after the push, but only
+    touches the pieces, castling rights and en passant file that changed.
+    """
+    turn = board.turn
+    # zobrist_hash only counts rights that can still be used (a king and rook on their squares)
+    castling_rights = board.clean_castling_rights()
+    key ^= _TURN_KEY
+    if board.ep_square is not None:
+        key ^= _HASHER.hash_ep_square(board)
+    piece_type = board.piece_type_at(move.from_square)
+    key ^= _piece_key(piece_type, turn, move.from_square)
+
+    if board.is_castling(move):
+        rank_start = move.from_square & ~7
+        if board.is_kingside_castling(move):
+            king_to, rook_from, rook_to = rank_start + 6, rank_start + 7, rank_start + 5
+        else:
+            king_to, rook_from, rook_to = rank_start + 2, rank_start, rank_start + 3
+        key ^= _piece_key(chess.KING, turn, king_to)
+        key ^= _piece_key(chess.ROOK, turn, rook_from) ^ _piece_key(chess.ROOK, turn, rook_to)
+    else:
+        if board.is_en_passant(move):
+            captured_square = move.to_square - 8 if turn == chess.WHITE else move.to_square + 8
+            key ^= _piece_key(chess.PAWN, not turn, captured_square)
+        else:
+            captured = board.piece_type_at(move.to_square)
+            if captured:
+                key ^= _piece_key(captured, not turn, move.to_square)
+        key ^= _piece_key(move.promotion or piece_type, turn, move.to_square)
+
+    board.push(move)
+    new_castling_rights = board.clean_castling_rights()
+    if new_castling_rights != castling_rights:
+        key ^= _castling_key(castling_rights) ^ _castling_key(new_castling_rights)
+    if board.ep_square is not None:
+        key ^= _HASHER.hash_ep_square(board)
+    return key
+
+
+def score_to_tt(score, ply):
+    """Make a mate score relative to the node at ply instead of the root, for storing."""
+    if score > MATE_SCORE - MAX_DEPTH:
+        return score + ply
+    if score < -MATE_SCORE + MAX_DEPTH:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    """Turn a stored mate score back into one relative to the root."""
+    if score > MATE_SCORE - MAX_DEPTH:
+        return score - ply
+    if score < -MATE_SCORE + MAX_DEPTH:
+        return score + ply
+    return score
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when a limit is hit or a stop is requested."""
+
+
+class Searcher:
+    """Iterative-deepening alpha-beta search with quiescence and a transposition table."""
+
+    def __init__(self, evaluator=None, hash_mb=16):
+        self.evaluator = evaluator or ClassicEvaluator()
+        self.set_hash_size(hash_mb)
+        self.stop_event = None
+        self.deadline = None
+        self.node_limit = None
+        self.nodes = 0
+        self.root_moves = []
+        self.incremental = False
+
+    def set_hash_size(self, hash_mb):
+        """Resize (and clear) the transposition table."""
+        self.tt_capacity = max(1, hash_mb * 1024 * 1024 // TT_ENTRY_BYTES)
+        self.tt = {}
+
+    def clear(self):
+        """Forget everything learned from earlier searches (e.g. for a new game)."""
+        self.tt = {}
+
+    def search(self, board, depth=None, nodes=None, time_limit=None, stop_event=None, on_info=None):
+        """Search a position within the given limits and return (best move, score in centipawns).
+
+        The score is from the side to move's point of view. `deadline` may be
+        changed from another thread while the search runs (e.g. on ponderhit).
+        on_info is called with (depth, score, nodes, elapsed seconds, pv) after
+        each completed iteration.
+        """
+        start = time.monotonic()
+        self.deadline = start + time_limit if time_limit is not None else None
+        self.node_limit = nodes
+        self.stop_event = stop_event
+        self.nodes = 0
+        if hasattr(self.evaluator, 'reset_stats'):
+            self.evaluator.reset_stats()
+        board = board.copy()
+        key = chess.polyglot.zobrist_hash(board)
+        self.root_moves = self.order_root_moves(board)
+
+        # Evaluators with push/pop hooks (e.g. NNUE) follow the search move by move
+        self.incremental = hasattr(self.evaluator, 'push')
+        if self.incremental:
+            self.evaluator.set_position(board)
+
+        best_move = None
+        best_score = 0
+        try:
+            for current_depth in range(1, (MAX_DEPTH if depth is None else depth) + 1):
+                try:
+                    score = self.negamax(board, key, current_depth, -MATE_SCORE - 1, MATE_SCORE + 1, 0)
+                except SearchAborted:
+                    break
+
+                best_score = score
+                best_move = self.tt.get(key, (None, None, None, None))[3]
+                if on_info:
+                    on_info(current_depth, score, self.nodes, time.monotonic() - start,
+                            self.principal_variation(board))
+
+                # No point searching deeper once a forced mate has been found
+                if abs(score) > MATE_SCORE - MAX_DEPTH:
+                    break
+        finally:
+            if self.incremental:
+                self.evaluator.clear_position()
+
+        # If even depth 1 was interrupted, fall back to the best-looking legal move
+        if best_move is None:
+            best_move = self.root_moves[0] if self.root_moves else None
+        return best_move, best_score
+
+    def order_root_moves(self, board):
+        """Root moves sorted by the static evaluation after each, scored in one evaluate_batch call."""
+        moves = list(board.legal_moves)
+        if len(moves) < 2 or not hasattr(self.evaluator, 'evaluate_batch'):
+            return moves
+        children = []
+        for move in moves:
+            child = board.copy(stack=False)
+            child.push(move)
+            children.append(child)
+        scores = np.asarray(self.evaluator.evaluate_batch(children))
+        if board.turn == chess.WHITE:
+            scores = -scores
+        return [moves[i] for i in np.argsort(scores, kind='stable')]
+
+    def make_move(self, board, move, key):
+        """Push a move, keeping an incremental evaluator in step. Returns the new Zobrist key."""
+        if self.incremental:
+            self.evaluator.push(board, move)
+        return push_with_key(board, move, key)
+
+    def unmake_move(self, board):
+        board.pop()
+        if self.incremental:
+            self.evaluator.pop()
+
+    def principal_variation(self, board, max_length=MAX_DEPTH):
+        """Follow best moves stored in the transposition table."""
+        pv = []
+        board = board.copy()
+        while len(pv) < max_length:
+            entry = self.tt.get(chess.polyglot.zobrist_hash(board))
+            if entry is None or entry[3] is None or not board.is_legal(entry[3]):
+                break
+            pv.append(entry[3])
+            board.push(entry[3])
+        return pv
+
+    def check_limits(self):
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise SearchAborted()
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise SearchAborted()
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchAborted()
+
+    def telemetry(self):
+        """Counters from the last search: nodes plus the evaluator's cache hits and misses."""
+        counters = {'nodes': self.nodes}
+        if hasattr(self.evaluator, 'stats'):
+            counters.update(self.evaluator.stats())
+        return counters
+
+    def evaluate(self, board, key):
+        """Static evaluation from the side to move's point of view."""
+        score = self.evaluator.evaluate(board, key)
+        return score if board.turn == chess.WHITE else -score
+
+    def order_moves(self, board, moves, tt_move=None):
+        """Hash move first, then captures by most valuable victim / least valuable attacker."""
+        def key(move):
+            if move == tt_move:
+                return -100000
+            score = 0
+            victim = board.piece_type_at(move.to_square)
+            if victim:
+                score -= 10 * PIECE_VALUES[victim] - PIECE_VALUES[board.piece_type_at(move.from_square)]
+            elif board.is_en_passant(move):
+                score -= 9 * PIECE_VALUES[chess.PAWN]
+            if move.promotion:
+                score -= PIECE_VALUES[move.promotion]
+            return score
+        return sorted(moves, key=key)
+
+    def store(self, key, depth, score, bound, move, ply=0):
+        """Store a search result; mate scores are kept relative to the node, not the root."""
+        if len(self.tt) >= self.tt_capacity and key not in self.tt:
+            self.tt.clear()
+        self.tt[key] = (depth, score_to_tt(score, ply), bound, move)
+
+    def negamax(self, board, key, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0:
+            self.check_limits()
+
+        if ply > 0 and (board.is_repetition(2) or board.halfmove_clock >= 100):
+            return 0
+
+        entry = self.tt.get(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, entry_score, bound, tt_move = entry
+            entry_score = score_from_tt(entry_score, ply)
+            if ply > 0 and entry_depth >= depth:
+                if bound == EXACT:
+                    return entry_score
+                if bound == LOWER and entry_score >= beta:
+                    return entry_score
+                if bound == UPPER and entry_score <= alpha:
+                    return entry_score
+
+        if depth <= 0:
+            return self.quiescence(board, key, alpha, beta, ply)
+
+        if ply == 0:
+            moves = self.root_moves
+            ordered = ([tt_move] if tt_move in moves else []) + [move for move in moves if move != tt_move]
+        else:
+            moves = list(board.legal_moves)
+            ordered = self.order_moves(board, moves, tt_move)
+        if not moves:
+            return -MATE_SCORE + ply if board.is_check() else 0
+
+        original_alpha = alpha
+        best_score = -MATE_SCORE - 1
+        best_move = None
+        for move in ordered:
+            child_key = self.make_move(board, move, key)
+            score = -self.negamax(board, child_key, depth - 1, -beta, -alpha, ply + 1)
+            self.unmake_move(board)
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.store(key, depth, best_score, bound, best_move, ply)
+        return best_score
+
+    def quiescence(self, board, key, alpha, beta, ply):
+        """Search captures only, so the static evaluation is not taken in the middle of an exchange."""
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0:
+            self.check_limits()
+
+        stand_pat = self.evaluate(board, key)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        for move in self.order_moves(board, board.generate_legal_captures()):
+            child_key = self.make_move(board, move, key)
+            score = -self.quiescence(board, child_key, -beta, -alpha, ply + 1)
+            self.unmake_move(board)
+
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
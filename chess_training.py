@@ -0,0 +1,343 @@
+import argparse
+import collections
+import glob
+import itertools
+import multiprocessing
+import os
+import random
+import time
+
+import chess
+import numpy as np
+
+from chess_archive import GameArchive
+from chess_eval import (PIECE_VALUES, PIECE_SQUARE_TABLES, board_to_masks, masks_to_codes,
+                        save_piece_square_tables, encode_move)
+from chess_search import Searcher
+
+DEFAULT_DATA_DIR = "training"
+SHARD_SUFFIX = ".bin"
+RECORDS_PER_SHARD = 1 << 20
+
+# One training position: the 64 piece codes of chess_eval packed two per byte
+# (even square in the low nibble), the side to move (0 white, 1 black), the
+# search score in centipawns from White's point of view, the game result
+# (0 black won, 1 draw, 2 white won) and the best move packed by encode_move
+RECORD_DTYPE = np.dtype([
+    ('board', 'u1', 32),
+    ('turn', 'u1'),
+    ('score', '<i2'),
+    ('result', 'u1'),
+    ('move', '<u2'),
+])
+
+RESULT_CODES = {'0-1': 0, '1/2-1/2': 1, '1-0': 2}
+
+Batch = collections.namedtuple('Batch', 'codes turn score result move')
+
+_SQUARES = np.arange(64)
+
+# For each piece code and square, the piece-square table entry it uses
+# (piece type * 64 + square from White's side) and the sign it enters the score with
+_FEATURE_INDEX = np.zeros((13, 64), dtype=np.int64)
+_FEATURE_SIGN = np.zeros((13, 64), dtype=np.float64)
+for _code in range(1, 13):
+    _piece_type = (_code - 1) % 6 + 1
+    if _code <= 6:
+        _FEATURE_INDEX[_code] = _piece_type * 64 + _SQUARES
+        _FEATURE_SIGN[_code] = 1.0
+    else:
+        _FEATURE_INDEX[_code] = _piece_type * 64 + (_SQUARES ^ 56)
+        _FEATURE_SIGN[_code] = -1.0
+
+
+def pack_codes(codes):
+    """Pack piece codes of shape (..., 64) into nibbles of shape (..., 32)."""
+    codes = np.asarray(codes, dtype=np.uint8)
+    return codes[..., 0::2] | (codes[..., 1::2] << 4)
+
+
+def unpack_codes(packed):
+    """Unpack nibbles of shape (..., 32) into piece codes of shape (..., 64)."""
+    packed = np.asarray(packed, dtype=np.uint8)
+    return np.stack([packed & 15, packed >> 4], axis=-1).reshape(packed.shape[:-1] + (64,))
+
+
+class ShardWriter:
+    """Streams training positions into fixed-size shard files.
+
+    Positions are held back until their game's result is known, then written
+    in one go. Writing resumes in the last shard with the same prefix.
+    """
+
+    def __init__(self, directory=DEFAULT_DATA_DIR, prefix='shard', records_per_shard=RECORDS_PER_SHARD):
+        self.directory = directory
+        self.prefix = prefix
+        self.records_per_shard = records_per_shard
+        self.pending = []
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+
+        existing = sorted(glob.glob(os.path.join(directory, f"{prefix}-*{SHARD_SUFFIX}")))
+        self.shard_number = len(existing) - 1 if existing else 0
+
+    def shard_path(self):
+        return os.path.join(self.directory, f"{self.prefix}-{self.shard_number:05d}{SHARD_SUFFIX}")
+
+    def add(self, board, score, best_move):
+        """Record a position with its White-positive search score and best move."""
+        codes = masks_to_codes(board_to_masks(board))
+        self.pending.append((pack_codes(codes), int(board.turn == chess.BLACK),
+                             max(-32767, min(32767, score)), encode_move(best_move)))
+
+    def finish_game(self, result):
+        """Write the pending positions with the game's result; unfinished games ('*') are dropped."""
+        pending, self.pending = self.pending, []
+        if result not in RESULT_CODES or not pending:
+            return
+
+        records = np.zeros(len(pending), dtype=RECORD_DTYPE)
+        records['board'] = np.array([entry[0] for entry in pending])
+        records['turn'] = [entry[1] for entry in pending]
+        records['score'] = [entry[2] for entry in pending]
+        records['move'] = [entry[3] for entry in pending]
+        records['result'] = RESULT_CODES[result]
+        self.write(records)
+
+    def write(self, records):
+        """Append records, starting a new shard whenever the current one is full."""
+        while len(records):
+            path = self.shard_path()
+            used = os.path.getsize(path) // RECORD_DTYPE.itemsize if os.path.exists(path) else 0
+            if used >= self.records_per_shard:
+                self.shard_number += 1
+                continue
+            chunk, records = records[:self.records_per_shard - used], records[self.records_per_shard - used:]
+            with open(path, 'ab') as f:
+                f.write(chunk.tobytes())
+            self.written += len(chunk)
+
+
+class TrainingDataset:
+    """Memory-maps every shard in a directory and serves shuffled mini-batches.
+
+    Batches are gathered with NumPy fancy indexing straight from the maps, so
+    no Python object is created per record.
+    """
+
+    def __init__(self, directory=DEFAULT_DATA_DIR):
+        self.shards = []
+        for path in sorted(glob.glob(os.path.join(directory, f"*{SHARD_SUFFIX}"))):
+            # A shard cut short by a crash ends in a partial record; ignore it
+            count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+            if count:
+                self.shards.append(np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,)))
+        self.starts = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def records(self, indices):
+        """Gather the records at global indices into one array."""
+        shard_of = np.searchsorted(self.starts, indices, side='right') - 1
+        records = np.empty(len(indices), dtype=RECORD_DTYPE)
+        for shard in np.unique(shard_of):
+            selected = shard_of == shard
+            records[selected] = self.shards[shard][indices[selected] - self.starts[shard]]
+        return records
+
+    def batches(self, batch_size=4096, shuffle=True, seed=None):
+        """Yield Batch tuples covering the dataset once, in random order if shuffle is set."""
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else np.arange(len(self))
+        for start in range(0, len(order), batch_size):
+            records = self.records(order[start:start + batch_size])
+            yield Batch(unpack_codes(records['board']), records['turn'], records['score'].astype(np.int32),
+                        records['result'], records['move'])
+
+
+def record_game(searcher, writer, moves=None, depth=2, nodes=None, random_plies=8, max_plies=200,
+                result=None, quiet_only=True, rng=random):
+    """Search each position of a game and record it.
+
+    With moves=None the searcher plays the game itself, after random_plies
+    random opening moves; otherwise the given moves are replayed and result
+    is the game's known result. quiet_only skips positions in check or whose
+    best move is a capture, where the static evaluation is least reliable.
+    """
+    board = chess.Board()
+    for ply in range(max_plies if moves is None else len(moves)):
+        if board.is_game_over(claim_draw=True):
+            break
+        if moves is None and ply < random_plies:
+            board.push(rng.choice(list(board.legal_moves)))
+            continue
+
+        best_move, score = searcher.search(board, depth=depth, nodes=nodes)
+        if not quiet_only or not (board.is_check() or board.is_capture(best_move)):
+            writer.add(board, score if board.turn == chess.WHITE else -score, best_move)
+        board.push(best_move if moves is None else moves[ply])
+
+    writer.finish_game(result if result is not None else board.result(claim_draw=True))
+
+
+def selfplay_worker(args):
+    """Pool worker: play games into its own shard prefix. Returns the number of positions written."""
+    worker, games, directory, depth, nodes, random_plies, max_plies = args
+    rng = random.Random(f"{worker}-{time.time()}")
+    writer = ShardWriter(directory, prefix=f"selfplay{worker}")
+    searcher = Searcher()
+    for _ in range(games):
+        searcher.clear()
+        record_game(searcher, writer, depth=depth, nodes=nodes, random_plies=random_plies,
+                    max_plies=max_plies, rng=rng)
+    return writer.written
+
+
+def generate_selfplay(directory, games, workers=4, depth=2, nodes=None, random_plies=8, max_plies=200):
+    """Play games across a process pool. Returns the number of positions written."""
+    workers = max(1, min(workers, games))
+    shares = [games // workers + (i < games % workers) for i in range(workers)]
+    jobs = [(i, share, directory, depth, nodes, random_plies, max_plies) for i, share in enumerate(shares)]
+    with multiprocessing.Pool(workers) as pool:
+        return sum(pool.map(selfplay_worker, jobs))
+
+
+def analyse_archive(archive_path, directory, depth=2, nodes=None):
+    """Record the positions of finished games in a game archive. Returns the number written."""
+    writer = ShardWriter(directory, prefix='archive')
+    searcher = Searcher()
+    for game in GameArchive(archive_path):
+        if game.result in RESULT_CODES and not game.fen:
+            searcher.clear()
+            record_game(searcher, writer, moves=game.moves, depth=depth, nodes=nodes, result=game.result)
+    return writer.written
+
+
+class TexelTuner:
+    """Fits piece-square tables so that a sigmoid of the evaluation predicts game results.
+
+    The model is the material plus piece-square part of ClassicEvaluator
+    (material stays fixed). The target is the game result, optionally blended
+    with the recorded search score, and the tables are fitted by mini-batch
+    gradient descent (Adam) on the mean squared error.
+    """
+
+    def __init__(self, piece_values=PIECE_VALUES, piece_square_tables=PIECE_SQUARE_TABLES, scale=1.0,
+                 score_weight=0.0):
+        self.piece_values = np.asarray(piece_values, dtype=np.float64)
+        self.tables = np.asarray(piece_square_tables, dtype=np.float64).copy()
+        self.scale = scale
+        self.score_weight = score_weight
+
+    def win_probability(self, scores):
+        return 1.0 / (1.0 + 10.0 ** (-self.scale * scores / 400.0))
+
+    def evaluate(self, codes):
+        """White-positive scores of piece codes of shape (n, 64) under the current tables."""
+        parameters = (self.piece_values[:, None] + self.tables).ravel()
+        return (parameters[_FEATURE_INDEX[codes, _SQUARES]] * _FEATURE_SIGN[codes, _SQUARES]).sum(axis=-1)
+
+    def targets(self, batch):
+        target = batch.result / 2.0
+        if self.score_weight:
+            target = (1 - self.score_weight) * target + self.score_weight * self.win_probability(batch.score)
+        return target
+
+    def error(self, batch):
+        return float(np.mean((self.targets(batch) - self.win_probability(self.evaluate(batch.codes))) ** 2))
+
+    def fit_scale(self, batches, candidates=np.linspace(0.2, 3.0, 57)):
+        """Pick the sigmoid scale that best fits the current tables, as Texel tuning starts by doing."""
+        best = None
+        for scale in candidates:
+            self.scale = scale
+            error = sum(self.error(batch) * len(batch.result) for batch in batches)
+            if best is None or error < best[0]:
+                best = (error, scale)
+        self.scale = best[1]
+        return self.scale
+
+    def gradient(self, batch):
+        """Gradient of the mean squared error with respect to the tables."""
+        probability = self.win_probability(self.evaluate(batch.codes))
+        d_score = (-2.0 / len(probability)) * (self.targets(batch) - probability) \
+            * probability * (1 - probability) * np.log(10) * self.scale / 400.0
+        index = _FEATURE_INDEX[batch.codes, _SQUARES]
+        weights = _FEATURE_SIGN[batch.codes, _SQUARES] * d_score[:, None]
+        return np.bincount(index.ravel(), weights=weights.ravel(), minlength=7 * 64).reshape(7, 64)
+
+    def tune(self, dataset, epochs=10, batch_size=16384, learning_rate=1.0, seed=None, on_epoch=None):
+        """Run Adam over the dataset; on_epoch is called with (epoch, mean error)."""
+        first_moment = np.zeros_like(self.tables)
+        second_moment = np.zeros_like(self.tables)
+        step = 0
+        for epoch in range(epochs):
+            total_error = 0.0
+            for batch in dataset.batches(batch_size, seed=None if seed is None else seed + epoch):
+                step += 1
+                gradient = self.gradient(batch)
+                first_moment = 0.9 * first_moment + 0.1 * gradient
+                second_moment = 0.999 * second_moment + 0.001 * gradient ** 2
+                corrected = first_moment / (1 - 0.9 ** step)
+                self.tables -= learning_rate * corrected / (np.sqrt(second_moment / (1 - 0.999 ** step)) + 1e-12)
+                total_error += self.error(batch) * len(batch.result)
+            if on_epoch:
+                on_epoch(epoch + 1, total_error / max(len(dataset), 1))
+        return self.rounded_tables()
+
+    def rounded_tables(self):
+        return np.rint(self.tables).astype(np.int32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training data generation and evaluation tuning")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+
+    generate = subparsers.add_parser('generate', help="record positions from self-play games")
+    generate.add_argument('--games', type=int, default=10)
+    generate.add_argument('--workers', type=int, default=4)
+    generate.add_argument('--random-plies', type=int, default=8, help="random opening moves for variety")
+    generate.add_argument('--max-plies', type=int, default=200)
+
+    analyse = subparsers.add_parser('analyse', help="record positions from finished games in a game archive")
+    analyse.add_argument('--archive', default=os.path.join("games", "archive.cga"))
+
+    for sub in (generate, analyse):
+        sub.add_argument('--depth', type=int, default=2)
+        sub.add_argument('--nodes', type=int)
+        sub.add_argument('--output', default=DEFAULT_DATA_DIR, help="directory the shards are written to")
+
+    tune = subparsers.add_parser('tune', help="fit piece-square tables to recorded positions")
+    tune.add_argument('--data', default=DEFAULT_DATA_DIR)
+    tune.add_argument('--epochs', type=int, default=10)
+    tune.add_argument('--batch-size', type=int, default=16384)
+    tune.add_argument('--learning-rate', type=float, default=1.0)
+    tune.add_argument('--score-weight', type=float, default=0.0, help="blend the search score into the target")
+    tune.add_argument('--output', default="tuned_pst.npy")
+
+    args = parser.parse_args()
+    start = time.time()
+
+    if args.mode == 'generate':
+        count = generate_selfplay(args.output, args.games, args.workers, args.depth, args.nodes,
+                                  args.random_plies, args.max_plies)
+        print(f"Wrote {count} positions to {args.output}/ in {time.time() - start:.1f}s")
+    elif args.mode == 'analyse':
+        count = analyse_archive(args.archive, args.output, args.depth, args.nodes)
+        print(f"Wrote {count} positions to {args.output}/ in {time.time() - start:.1f}s")
+    else:
+        dataset = TrainingDataset(args.data)
+        if not len(dataset):
+            print(f"No training positions found in {args.data}/")
+            return
+        tuner = TexelTuner(score_weight=args.score_weight)
+        sample = list(itertools.islice(dataset.batches(args.batch_size, seed=0), 8))
+        print(f"{len(dataset)} positions, sigmoid scale {tuner.fit_scale(sample):.2f}, "
+              f"initial error {tuner.error(sample[0]):.5f}")
+        tables = tuner.tune(dataset, args.epochs, args.batch_size, args.learning_rate,
+                            on_epoch=lambda epoch, error: print(f"epoch {epoch}: error {error:.5f}"))
+        save_piece_square_tables(args.output, tables)
+        print(f"Saved tuned tables to {args.output} in {time.time() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import sys
+import threading
+import time
+
+import chess
+
+from chess_eval import ClassicEvaluator, load_piece_square_tables
+from chess_nnue import NNUEEvaluator
+from chess_search import Searcher, MATE_SCORE, MAX_DEPTH
+
+ENGINE_NAME = "Chess Player AI"
+ENGINE_AUTHOR = "Chess Player AI contributors"
+
+# Time management: fraction of the remaining clock to spend, and a safety margin
+DEFAULT_MOVES_TO_GO = 30
+MOVE_OVERHEAD = 0.05
+
+
+def format_score(score):
+    """UCI score string for a centipawn score from the side to move's point of view."""
+    if abs(score) > MATE_SCORE - MAX_DEPTH:
+        plies = MATE_SCORE - abs(score)
+        moves = (plies + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {score}"
+
+
+def parse_go(tokens):
+    """Turn the arguments of a 'go' command into a dict of limits."""
+    limits = {}
+    integer_args = ('depth', 'nodes', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo')
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in integer_args and i + 1 < len(tokens):
+            # A malformed value is skipped rather than failing the whole command
+            if tokens[i + 1].lstrip('-').isdigit():
+                limits[token] = int(tokens[i + 1])
+            i += 2
+        else:
+            if token in ('infinite', 'ponder'):
+                limits[token] = True
+            i += 1
+    return limits
+
+
+def time_budget(limits, turn):
+    """Seconds to search for, or None for no time limit."""
+    if 'movetime' in limits:
+        return max(0.0, limits['movetime'] / 1000 - MOVE_OVERHEAD)
+
+    remaining = limits.get('wtime' if turn == chess.WHITE else 'btime')
+    if remaining is None:
+        return None
+    increment = limits.get('winc' if turn == chess.WHITE else 'binc', 0)
+    moves_to_go = limits.get('movestogo', DEFAULT_MOVES_TO_GO)
+
+    budget = remaining / max(moves_to_go, 1) + increment * 0.8
+    # Never plan to use more than half of what is left on the clock
+    return max(0.01, min(budget, remaining / 2) / 1000 - MOVE_OVERHEAD)
+
+
+class UCIServer:
+    """Speaks UCI on stdin/stdout, searching on a background thread so commands are always read."""
+
+    def __init__(self, input_stream=sys.stdin, output_stream=sys.stdout):
+        self.input = input_stream
+        self.output = output_stream
+        self.output_lock = threading.Lock()
+
+        self.searcher = Searcher()
+        self.threads = 1
+        self.board = chess.Board()
+
+        self.search_thread = None
+        self.stop_event = threading.Event()
+        # Set when a pondering or infinite search is allowed to report its best move
+        self.release_event = threading.Event()
+        self.pending_budget = None
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self):
+        """Read and handle commands until 'quit' or end of input."""
+        for line in self.input:
+            if not self.handle(line.strip()):
+                break
+        self.stop_search()
+
+    def handle(self, line):
+        """Handle one command line. Returns False when the engine should exit."""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+
+        if command == 'uci':
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send("option name Hash type spin default 16 min 1 max 4096")
+            self.send("option name Threads type spin default 1 min 1 max 64")
+            self.send("option name Ponder type check default false")
+            self.send("option name PieceSquareTables type string default <empty>")
+            self.send("option name EvalFile type string default <empty>")
+            self.send("uciok")
+        elif command == 'isready':
+            self.send("readyok")
+        elif command == 'setoption':
+            self.set_option(args)
+        elif command == 'ucinewgame':
+            self.stop_search()
+            self.searcher.clear()
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(args)
+        elif command == 'go':
+            self.stop_search()
+            self.start_search(parse_go(args))
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'quit':
+            return False
+        return True
+
+    def set_option(self, args):
+        """Handle 'setoption name <name> value <value>'."""
+        if 'name' not in args:
+            return
+        name_end = args.index('value') if 'value' in args else len(args)
+        name = " ".join(args[args.index('name') + 1:name_end]).lower()
+        value = " ".join(args[name_end + 1:])
+
+        if name in ('hash', 'threads'):
+            try:
+                number = int(value)
+            except ValueError:
+                self.send(f"info string invalid value for {name}: {value}")
+                return
+            if name == 'hash':
+                self.stop_search()
+                self.searcher.set_hash_size(number)
+            else:
+                # The search is single-threaded; the option is accepted so GUIs and match
+                # runners that always send it keep working
+                self.threads = number
+        elif name in ('piecesquaretables', 'evalfile'):
+            self.stop_search()
+            try:
+                self.searcher.evaluator = self.load_evaluator(name, value)
+            except (OSError, ValueError) as e:
+                self.send(f"info string could not load {value}: {e}")
+            self.searcher.clear()
+
+    def load_evaluator(self, option, path):
+        """Evaluator for the PieceSquareTables or EvalFile option; empty means the default one."""
+        if not path or path == '<empty>':
+            return ClassicEvaluator()
+        if option == 'evalfile':
+            # HalfKP network weights (see chess_nnue.py)
+            return NNUEEvaluator.load(path)
+        # Tables fitted by 'python chess_training.py tune'
+        return ClassicEvaluator(piece_square_tables=load_piece_square_tables(path))
+
+    def set_position(self, args):
+        """Handle 'position startpos|fen <fen> [moves ...]'."""
+        if not args:
+            return
+        if 'moves' in args:
+            moves_at = args.index('moves')
+            moves = args[moves_at + 1:]
+            args = args[:moves_at]
+        else:
+            moves = []
+
+        # On a bad FEN or move the previous position is kept
+        try:
+            if args[0] == 'startpos':
+                board = chess.Board()
+            elif args[0] == 'fen':
+                board = chess.Board(" ".join(args[1:]))
+            else:
+                return
+
+            for uci in moves:
+                board.push_uci(uci)
+        except ValueError as e:
+            self.send(f"info string invalid position: {e}")
+            return
+        self.board = board
+
+    def start_search(self, limits):
+        """Start searching self.board on a background thread."""
+        self.stop_event.clear()
+        self.release_event.clear()
+
+        budget = time_budget(limits, self.board.turn)
+        if limits.get('ponder'):
+            # Search without a time limit until ponderhit tells us our prediction came true
+            self.pending_budget = budget
+            budget = None
+        else:
+            self.pending_budget = None
+        if not limits.get('ponder') and not limits.get('infinite'):
+            self.release_event.set()
+
+        self.search_thread = threading.Thread(
+            target=self.search, args=(self.board.copy(), limits.get('depth'), limits.get('nodes'), budget),
+            daemon=True)
+        self.search_thread.start()
+
+    def search(self, board, depth, nodes, budget):
+        """Body of the search thread."""
+        def on_info(completed_depth, score, searched_nodes, elapsed, pv):
+            nps = int(searched_nodes / elapsed) if elapsed > 0 else 0
+            self.send(f"info depth {completed_depth} score {format_score(score)} nodes {searched_nodes} nps {nps} "
+                      f"time {int(elapsed * 1000)} pv {' '.join(move.uci() for move in pv)}")
+
+        move, _ = self.searcher.search(board, depth=depth, nodes=nodes, time_limit=budget,
+                                       stop_event=self.stop_event, on_info=on_info)
+        self.send_telemetry()
+
+        # UCI forbids reporting a move while pondering or in infinite mode until told to stop
+        self.release_event.wait()
+
+        if move is None:
+            self.send("bestmove 0000")
+            return
+        ponder_move = None
+        board.push(move)
+        pv = self.searcher.principal_variation(board, max_length=1)
+        if pv:
+            ponder_move = pv[0]
+        self.send(f"bestmove {move.uci()}" + (f" ponder {ponder_move.uci()}" if ponder_move else ""))
+
+    def send_telemetry(self):
+        """Report the evaluator's cache hit rates for the last search."""
+        parts = []
+        for name, counters in self.searcher.telemetry().items():
+            if name == 'nodes':
+                continue
+            hits, misses = counters
+            rate = 100 * hits / (hits + misses) if hits + misses else 0.0
+            parts.append(f"{name} hits {hits} misses {misses} ({rate:.1f}%)")
+        if parts:
+            self.send("info string " + ", ".join(parts))
+
+    def ponderhit(self):
+        """The opponent played the move we pondered on: switch to a normal timed search."""
+        if self.search_thread is None or not self.search_thread.is_alive():
+            return
+        if self.pending_budget is not None:
+            self.searcher.deadline = time.monotonic() + self.pending_budget
+        self.release_event.set()
+
+    def stop_search(self):
+        """Stop any running search and wait for it to report its move."""
+        if self.search_thread is not None:
+            self.stop_event.set()
+            self.release_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+
+def main():
+    UCIServer().run()
+
+if __name__ == "__main__":
+    main()
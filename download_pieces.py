@@ -1,7 +1,6 @@
 import os
-import urllib.request
 import zipfile
-import io
+from asset_fetch import fetch_assets, FETCHED, FAILED
 
 def download_chess_pieces():
     """Download chess piece images from a GitHub repository."""
@@ -9,20 +8,18 @@ def download_chess_pieces():
     
     # URL for chess pieces (using a common open-source set)
     url = "https://github.com/lichess-org/lila/raw/master/public/piece/cburnett/standard.zip"
+    pieces_dir = "pieces"
     
     try:
-        # Create pieces directory if it doesn't exist
-        pieces_dir = "pieces"
-        if not os.path.exists(pieces_dir):
-            os.makedirs(pieces_dir)
+        # Download the zip file; it is kept so an unchanged archive is not fetched again
+        status = fetch_assets({"standard.zip": url}, pieces_dir)["standard.zip"]
+        if status == FAILED:
+            return False
         
-        # Download the zip file
-        response = urllib.request.urlopen(url)
-        zip_data = io.BytesIO(response.read())
-        
-        # Extract the zip file
-        with zipfile.ZipFile(zip_data) as zip_ref:
-            zip_ref.extractall(pieces_dir)
+        # Extract the zip file if it is new or has changed
+        if status == FETCHED:
+            with zipfile.ZipFile(os.path.join(pieces_dir, "standard.zip")) as zip_ref:
+                zip_ref.extractall(pieces_dir)
         
         print("Chess piece images downloaded successfully!")
         return True
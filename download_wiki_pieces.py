@@ -1,15 +1,10 @@
-import os
-import urllib.request
-import time
+from asset_fetch import fetch_assets, FAILED
 
 def download_chess_pieces():
     """Download chess piece images from Wikimedia Commons."""
     print("Downloading chess piece images from Wikimedia Commons...")
     
-    # Create pieces directory if it doesn't exist
     pieces_dir = "pieces"
-    if not os.path.exists(pieces_dir):
-        os.makedirs(pieces_dir)
     
     # URLs for the chess piece images
     piece_urls = {
@@ -30,30 +25,12 @@ def download_chess_pieces():
         'bK': 'https://upload.wikimedia.org/wikipedia/commons/f/f0/Chess_kdt45.svg',
     }
     
-    # Download each piece
-    for piece_name, url in piece_urls.items():
-        try:
-            # Determine file extension from URL
-            extension = url.split('.')[-1]
-            file_path = os.path.join(pieces_dir, f"{piece_name}.{extension}")
-            
-            # Skip if file already exists
-            if os.path.exists(file_path):
-                print(f"File {file_path} already exists, skipping...")
-                continue
-            
-            # Download the file
-            print(f"Downloading {piece_name} from {url}...")
-            urllib.request.urlretrieve(url, file_path)
-            
-            # Small delay to be nice to the server
-            time.sleep(0.5)
-            
-        except Exception as e:
-            print(f"Error downloading {piece_name}: {e}")
+    # Download all pieces concurrently; unchanged files are not transferred again
+    assets = {f"{piece_name}.{url.split('.')[-1]}": url for piece_name, url in piece_urls.items()}
+    results = fetch_assets(assets, pieces_dir)
     
     print("Download complete!")
-    return True
+    return FAILED not in results.values()
 
 if __name__ == "__main__":
     download_chess_pieces()
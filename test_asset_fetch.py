@@ -0,0 +1,120 @@
+import hashlib
+import http.server
+import os
+import tempfile
+import threading
+import unittest
+
+from asset_fetch import fetch_assets, load_manifest, FETCHED, NOT_MODIFIED, CACHED, FAILED, MANIFEST_NAME
+
+
+class AssetHandler(http.server.BaseHTTPRequestHandler):
+    """Serves self.server.files with ETags and counts full transfers."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = self.server.files.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.server.transfers.append(self.path)
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FetchAssetsTest(unittest.TestCase):
+    """fetch_assets against a local http.server stand-in."""
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), AssetHandler)
+        self.server.files = {'/wP.svg': b'<svg>pawn</svg>', '/wK.svg': b'<svg>king</svg>'}
+        self.server.transfers = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.assets = {'wP.svg': base + '/wP.svg', 'wK.svg': base + '/wK.svg'}
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dest = self.tmp.name
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def read(self, filename):
+        with open(os.path.join(self.dest, filename), 'rb') as f:
+            return f.read()
+
+    def test_fetch_then_not_modified_then_cached(self):
+        results = fetch_assets(self.assets, self.dest)
+        self.assertEqual(results, {'wP.svg': FETCHED, 'wK.svg': FETCHED})
+        self.assertEqual(self.read('wP.svg'), b'<svg>pawn</svg>')
+        manifest = load_manifest(os.path.join(self.dest, MANIFEST_NAME))
+        self.assertEqual(manifest['wK.svg']['sha256'], hashlib.sha256(b'<svg>king</svg>').hexdigest())
+
+        results = fetch_assets(self.assets, self.dest)
+        self.assertEqual(results, {'wP.svg': NOT_MODIFIED, 'wK.svg': NOT_MODIFIED})
+
+        results = fetch_assets(self.assets, self.dest, revalidate=False)
+        self.assertEqual(results, {'wP.svg': CACHED, 'wK.svg': CACHED})
+        self.assertEqual(len(self.server.transfers), 2)
+
+    def test_changed_asset_is_fetched_again(self):
+        fetch_assets(self.assets, self.dest)
+        self.server.files['/wP.svg'] = b'<svg>new pawn</svg>'
+
+        results = fetch_assets(self.assets, self.dest)
+        self.assertEqual(results, {'wP.svg': FETCHED, 'wK.svg': NOT_MODIFIED})
+        self.assertEqual(self.read('wP.svg'), b'<svg>new pawn</svg>')
+
+    def test_locally_modified_file_is_fetched_again(self):
+        fetch_assets(self.assets, self.dest)
+        with open(os.path.join(self.dest, 'wK.svg'), 'wb') as f:
+            f.write(b'corrupt')
+
+        results = fetch_assets(self.assets, self.dest, revalidate=False)
+        self.assertEqual(results, {'wP.svg': CACHED, 'wK.svg': FETCHED})
+        self.assertEqual(self.read('wK.svg'), b'<svg>king</svg>')
+
+    def test_existing_files_without_manifest_are_kept(self):
+        with open(os.path.join(self.dest, 'wP.svg'), 'wb') as f:
+            f.write(b'<svg>shipped pawn</svg>')
+
+        for _ in range(2):
+            results = fetch_assets(self.assets, self.dest)
+            self.assertEqual(results['wP.svg'], CACHED)
+        self.assertEqual(self.read('wP.svg'), b'<svg>shipped pawn</svg>')
+        self.assertEqual(self.server.transfers, ['/wK.svg'])
+
+    def test_malformed_url_fails_alone_and_manifest_is_saved(self):
+        assets = dict(self.assets, **{'bQ.svg': 'http://127.0.0.1:notaport/bQ.svg'})
+        results = fetch_assets(assets, self.dest)
+        self.assertEqual(results, {'wP.svg': FETCHED, 'wK.svg': FETCHED, 'bQ.svg': FAILED})
+        manifest = load_manifest(os.path.join(self.dest, MANIFEST_NAME))
+        self.assertEqual(sorted(manifest), ['wK.svg', 'wP.svg'])
+
+    def test_missing_asset_fails_without_leftovers(self):
+        results = fetch_assets({'bQ.svg': self.assets['wP.svg'].replace('wP', 'bQ')}, self.dest)
+        self.assertEqual(results, {'bQ.svg': FAILED})
+        self.assertEqual(sorted(os.listdir(self.dest)), [MANIFEST_NAME])
+
+
+if __name__ == "__main__":
+    unittest.main()
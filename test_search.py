@@ -0,0 +1,81 @@
+import random
+import unittest
+
+import chess
+import chess.polyglot
+
+from chess_search import Searcher, MATE_SCORE, EXACT, push_with_key
+
+
+class IncrementalKeyTest(unittest.TestCase):
+    """push_with_key must always agree with chess.polyglot.zobrist_hash."""
+
+    def assert_key_after(self, fen, uci):
+        board = chess.Board(fen)
+        key = push_with_key(board, chess.Move.from_uci(uci), chess.polyglot.zobrist_hash(board))
+        self.assertEqual(key, chess.polyglot.zobrist_hash(board))
+
+    def test_stale_castling_rights(self):
+        # Rights in the FEN without the king or rook on its square
+        self.assert_key_after("4k3/8/8/8/8/8/8/4K3 w KQ - 0 1", "e1f2")
+        self.assert_key_after("r3k3/8/8/8/8/8/8/4K2R w KQq - 0 1", "h1h8")
+
+    def test_castling_en_passant_and_promotion(self):
+        self.assert_key_after("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1", "e1g1")
+        self.assert_key_after("r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1", "e8c8")
+        self.assert_key_after("4k3/8/8/3Pp3/8/8/8/4K3 w - e6 0 2", "d5e6")
+        self.assert_key_after("1n2k3/P7/8/8/8/8/8/4K3 w - - 0 1", "a7b8q")
+
+    def test_random_games(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            board = chess.Board()
+            key = chess.polyglot.zobrist_hash(board)
+            while not board.is_game_over() and board.ply() < 200:
+                key = push_with_key(board, rng.choice(list(board.legal_moves)), key)
+                self.assertEqual(key, chess.polyglot.zobrist_hash(board))
+
+
+class MateScoreTest(unittest.TestCase):
+    """Mate scores in the transposition table are relative to the node they were found at."""
+
+    def test_mate_found_deeper_is_reported_relative_to_the_probing_ply(self):
+        searcher = Searcher()
+        board = chess.Board("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+        key = chess.polyglot.zobrist_hash(board)
+
+        # Mate in one from this node (one ply below it) found while it was at ply 3
+        searcher.store(key, 5, MATE_SCORE - 4, EXACT, chess.Move.from_uci("d1d8"), ply=3)
+
+        # Reached by transposition at ply 1, the mate is 2 plies from the root
+        self.assertEqual(searcher.negamax(board, key, 1, -MATE_SCORE - 1, MATE_SCORE + 1, 1), MATE_SCORE - 2)
+
+    def test_mated_score_round_trip(self):
+        searcher = Searcher()
+        board = chess.Board()
+        key = chess.polyglot.zobrist_hash(board)
+        searcher.store(key, 5, -MATE_SCORE + 6, EXACT, None, ply=4)
+        self.assertEqual(searcher.negamax(board, key, 1, -MATE_SCORE - 1, MATE_SCORE + 1, 2), -MATE_SCORE + 4)
+
+    def test_search_reports_mate_in_one(self):
+        move, score = Searcher().search(chess.Board("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1"), depth=4)
+        self.assertEqual(move, chess.Move.from_uci("d1d8"))
+        self.assertEqual(score, MATE_SCORE - 1)
+
+
+class DepthLimitTest(unittest.TestCase):
+
+    def test_depth_zero_does_not_search(self):
+        depths = []
+        move, _ = Searcher().search(chess.Board(), depth=0, on_info=lambda depth, *args: depths.append(depth))
+        self.assertEqual(depths, [])
+        self.assertIn(move, chess.Board().legal_moves)
+
+    def test_depth_limit_is_honoured(self):
+        depths = []
+        Searcher().search(chess.Board(), depth=2, on_info=lambda depth, *args: depths.append(depth))
+        self.assertEqual(depths, [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()